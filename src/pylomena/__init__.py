@@ -1,4 +1,6 @@
 from .types import *
 from .matcher import *
 from .api import *
+from .ratelimit import *
+from .aio import *
 from .sites import *
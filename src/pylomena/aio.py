@@ -0,0 +1,237 @@
+import asyncio
+import urllib
+import weakref
+
+from collections import deque
+from types import TracebackType
+from typing import cast, Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple, Type, TypeVar
+
+from .api import _decode_json, _retry_delay, _search_params, _Pagination, Site
+from .types import Filter, Image, Tag, JSONObject
+
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type: ignore[assignment]
+
+try:
+    import h2  # noqa: F401
+except ImportError:
+    HTTP2 = False
+else:
+    HTTP2 = True
+
+__all__ = ["AsyncSite", "AsyncPaginatedResult"]
+
+T = TypeVar("T")
+
+
+class AsyncSite:
+    """
+    asyncio counterpart to `Site`, based on httpx.
+    all requests share one client, so many paginations can run over few connections.
+    """
+    
+    validate_tag_slug = staticmethod(Site.validate_tag_slug)
+    tag_to_slug = staticmethod(Site.tag_to_slug)
+    
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 32,
+        max_retries: int = 5,
+        max_backoff: float = 60.0,
+        default_per_page: Optional[int] = 50,
+    ):
+        if httpx is None:
+            raise ImportError("AsyncSite requires httpx, install pylomena[async]")
+        
+        self.base_url = base_url
+        self.api_base = urllib.parse.urljoin(self.base_url, "/api/v1/json/")
+        if not self.api_base.endswith("/"):
+            self.api_base += "/"
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.default_per_page = default_per_page
+        
+        self.client = httpx.AsyncClient(http2=HTTP2, limits=httpx.Limits(max_connections=max_connections))
+        # paginators that may still be prefetching, they are stopped before the client is closed
+        self._paginators: "weakref.WeakSet[AsyncPaginatedResult[Any]]" = weakref.WeakSet()
+    
+    async def aclose(self) -> None:
+        "stop all paginators and release all pooled connections"
+        
+        for paginator in list(self._paginators):
+            await paginator.aclose()
+        await self.client.aclose()
+    
+    async def __aenter__(self) -> "AsyncSite":
+        return self
+    
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        await self.aclose()
+    
+    async def api_call(self, method: str, *args: Any, **kwargs: Any) -> "httpx.Response":
+        """
+        perform a GET API call to the endpoint `method`.
+        all other arguments are passed down to httpx.AsyncClient.get()
+        
+        throttled requests (HTTP 429) are retried up to `max_retries` times,
+        after that the last response is returned as is.
+        """
+        
+        url = self.api_base + method.lstrip("/")
+        
+        attempt = 0
+        while True:
+            response = await self.client.get(url, *args, **kwargs)
+            if response.status_code != 429 or attempt >= self.max_retries:
+                return response
+            
+            await asyncio.sleep(_retry_delay(response.headers, attempt, self.max_backoff))
+            attempt += 1
+    
+    def api_call_paginated(
+        self,
+        method: str,
+        slug: str,
+        *args: Any,
+        params: Optional[Dict[str, Any]] = None,
+        t: Optional[Callable] = None,
+        prefetch: int = 3,
+        **kwargs: Any
+    ) -> "AsyncPaginatedResult[T]":
+        """
+        get a full list that will be returned in parts
+        `slug` is the key in the JSON response that is to be concatenated
+        `prefetch` is the number of pages that are requested ahead in the background
+        """
+        
+        result: AsyncPaginatedResult[T] = AsyncPaginatedResult(
+            self, method, slug, *args, params=params, t=t, prefetch=prefetch, **kwargs
+        )
+        self._paginators.add(result)
+        return result
+    
+    async def _get_object(self, method: str, key: str) -> JSONObject:
+        response = await self.api_call(method)
+        response.raise_for_status()
+        return cast(JSONObject, _decode_json(response.content)[key])
+    
+    async def get_image(self, image_id: int) -> Image:
+        "load details for a given image_id"
+        
+        return Image(await self._get_object(f"images/{image_id:d}", "image"))
+    
+    async def get_tag(self, tag_slug: str) -> Tag:
+        "load details for a given slug"
+        
+        self.validate_tag_slug(tag_slug)
+        
+        return Tag(await self._get_object(f"tags/{urllib.parse.quote(tag_slug)}", "tag"))
+    
+    async def get_filter(self, filter_id: int) -> Filter:
+        "load details for a given filter_id"
+        
+        return Filter(await self._get_object(f"filters/{filter_id:d}", "filter"))
+    
+    def search_images(
+        self,
+        query: str,
+        sort_field: Optional[str] = None,
+        sort_direction: Optional[str] = None,
+        filter_id: Optional[int] = None,
+        per_page: Optional[int] = None,
+        key: Optional[str] = None
+    ) -> "AsyncPaginatedResult[Image]":
+        "search for images matching a query. returns an async iterable of images."
+        
+        params = _search_params(query, per_page, self.default_per_page, sort_field, sort_direction, filter_id, key)
+        return self.api_call_paginated("search/images", "images", params=params, t=Image)
+    
+    def search_tags(self, query: str, per_page: Optional[int] = None) -> "AsyncPaginatedResult[Tag]":
+        "search for tags matching a query. returns an async iterable of tags."
+        
+        params = _search_params(query, per_page, self.default_per_page)
+        return self.api_call_paginated("search/tags", "tags", params=params, t=Tag)
+    
+    def search_filters(self, query: str, per_page: Optional[int] = None) -> "AsyncPaginatedResult[Filter]":
+        "search for filters matching a query. returns an async iterable of filters."
+        
+        params = _search_params(query, per_page, self.default_per_page)
+        return self.api_call_paginated("search/filters", "filters", params=params, t=Filter)
+
+
+class AsyncPaginatedResult(_Pagination[T], AsyncIterator[T]):
+    """
+    asyncio counterpart to `PaginatedResult`.
+    the first page is only requested once iteration starts, `total` is set from then on.
+    """
+    
+    def __init__(
+        self,
+        site: AsyncSite,
+        method: str,
+        slug: str,
+        *args: Any,
+        params: Optional[Dict[str, Any]] = None,
+        t: Optional[Callable],
+        prefetch: int = 3,
+        **kwargs: Any,
+    ):
+        super().__init__(method, slug, args, params, t, prefetch, kwargs)
+        self.site = site
+        
+        self._pending: "Deque[asyncio.Task[Tuple[List[T], int]]]" = deque()
+    
+    def __aiter__(self) -> "AsyncPaginatedResult[T]":
+        return self
+    
+    async def __anext__(self) -> T:
+        if not self.results:
+            await self.fetch_next()
+            if not self.results:
+                await self.aclose()
+                raise StopAsyncIteration
+        
+        return self.results.popleft()
+    
+    def close(self) -> None:
+        "stop prefetching further pages, without waiting for requests that are already running to finish"
+        
+        while self._pending:
+            self._pending.popleft().cancel()
+    
+    async def aclose(self) -> None:
+        "stop prefetching further pages and wait until all of them are cancelled"
+        
+        pending = list(self._pending)
+        self.close()
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def fetch_next(self) -> None:
+        if self._exhausted:
+            return
+        
+        page = self.page + 1
+        if self._pending:
+            items, total = await self._pending.popleft()
+        else:
+            items, total = await self._fetch_page(page)
+        self._add_page(page, items, total)
+        
+        for page in self._pages_to_prefetch(len(self._pending)):
+            self._pending.append(asyncio.create_task(self._fetch_page(page)))
+    
+    async def _fetch_page(self, page: int) -> Tuple[List[T], int]:
+        "load a single page and return its items, already converted, and the reported total."
+        
+        response = await self.site.api_call(self.method, *self.args, params=self._page_params(page), **self.kwargs)
+        response.raise_for_status()
+        
+        return self._parse_page(response.content)
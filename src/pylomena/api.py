@@ -1,65 +1,233 @@
+import copy
+import email.utils
+import functools
+import json
+import random
+import re
 import requests
 import urllib
 import string
 import time
 
-from typing import cast, Any, Callable, Dict, Generic, Iterator, List, Optional, TypeVar
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from types import TracebackType
+from typing import cast, Any, Callable, Deque, Dict, Generic, Iterator, List, Mapping, Optional, Tuple, Type, TypeVar
 
-from .types import Filter, Image, Tag, JSONData
+from .ratelimit import RateLimiter
+from .types import Filter, Image, Tag, JSONData, JSONObject
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
 __all__ = ["Site"]
 
 T = TypeVar("T")
 
 
+def _decode_json(content: bytes) -> Any:
+    "decode a JSON response body, using orjson if it is installed"
+    
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def _retry_delay(headers: Mapping[str, str], attempt: int, max_backoff: float) -> float:
+    """
+    how long to wait before retrying a throttled request, shared by `Site` and `AsyncSite`.
+    honours the server's Retry-After header and falls back to exponential backoff.
+    """
+    
+    delay = Site._parse_retry_after(headers.get("Retry-After"))
+    if delay is None:
+        return min(2.0 ** (attempt + 1) + random.random(), max_backoff)
+    return min(max(delay, 0.0), max_backoff) + random.uniform(0, 0.5)
+
+
+def _search_params(
+    query: str,
+    per_page: Optional[int],
+    default_per_page: Optional[int],
+    sort_field: Optional[str] = None,
+    sort_direction: Optional[str] = None,
+    filter_id: Optional[int] = None,
+    key: Optional[str] = None,
+) -> Dict[str, Any]:
+    "the parameters of a search request, shared by `Site` and `AsyncSite`"
+    
+    params: Dict[str, Any] = {"q": query}
+    if sort_field:
+        params["sf"] = sort_field
+    if sort_direction:
+        params["sd"] = sort_direction
+    if filter_id is not None:
+        params["filter_id"] = int(filter_id)
+    if per_page is None:
+        per_page = default_per_page
+    if per_page:
+        params["per_page"] = int(per_page)
+    if key is not None:
+        params["key"] = key
+    return params
+
+
 class Site:
-    def __init__(self, base_url: str):
+    def __init__(
+        self,
+        base_url: str,
+        pool_connections: int = 4,
+        pool_maxsize: int = 32,
+        max_retries: int = 5,
+        max_backoff: float = 60.0,
+        default_per_page: Optional[int] = 50,
+        cache_size: Optional[int] = 1024,
+        rate_limit: bool = True,
+    ):
         self.base_url = base_url
         self.api_base = urllib.parse.urljoin(self.base_url, "/api/v1/json/")
+        if not self.api_base.endswith("/"):
+            self.api_base += "/"
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        # Philomena allows at most 50 results per page, fewer pages mean fewer requests
+        self.default_per_page = default_per_page
+        self.rate_limiter: Optional[RateLimiter] = RateLimiter() if rate_limit else None
+        
+        # details never change between calls, so only the raw JSON is kept.
+        # every get_* call wraps a deep copy of it, so changes to a returned object never reach the cache
+        self._image_cache = functools.lru_cache(maxsize=cache_size)(self._fetch_image_raw)
+        self._tag_cache = functools.lru_cache(maxsize=cache_size)(self._fetch_tag_raw)
+        self._filter_cache = functools.lru_cache(maxsize=cache_size)(self._fetch_filter_raw)
+        
+        # one session per site, so consecutive calls reuse keep-alive connections
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def close(self) -> None:
+        "release all pooled connections"
+        
+        self.session.close()
+    
+    def __enter__(self) -> "Site":
+        return self
+    
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
     
     def api_call(self, method: str, *args: Any, **kwargs: Any) -> requests.Response:
         """
         perform a GET API call to the endpoint `method`.
-        all other arguments are passed down to requests.get()
+        all other arguments are passed down to requests.Session.get()
+        
+        throttled requests (HTTP 429) are retried up to `max_retries` times,
+        after that the last response is returned as is.
         """
         
-        url = urllib.parse.urljoin(self.api_base, method)
-        return requests.get(url, *args, **kwargs)
+        # api_base always ends in a slash, so plain concatenation is enough
+        url = self.api_base + method.lstrip("/")
+        return self._request_with_retry(url, *args, **kwargs)
+    
+    def _request_with_retry(self, url: str, *args: Any, **kwargs: Any) -> requests.Response:
+        attempt = 0
+        while True:
+            limiter = self.rate_limiter
+            if limiter:
+                limiter.acquire()
+            
+            response = self.session.get(url, *args, **kwargs)
+            if response.status_code != 429:
+                if limiter:
+                    limiter.on_success()
+                return response
+            
+            if limiter:
+                limiter.on_rejected()
+            if attempt >= self.max_retries:
+                return response
+            time.sleep(_retry_delay(response.headers, attempt, self.max_backoff))
+            attempt += 1
+    
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        "parse a Retry-After header given either in seconds or as an HTTP date"
+        
+        if not value:
+            return None
+        
+        try:
+            return float(int(value))
+        except ValueError:
+            pass
+        
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+        return (date - datetime.now(timezone.utc)).total_seconds()
     
     def api_call_paginated(
         self,
         method: str,
         slug: str,
         *args: Any,
-        params: Dict[str, Any] = {},
+        params: Optional[Dict[str, Any]] = None,
         t: Optional[Callable] = None,
+        prefetch: int = 3,
         **kwargs: Any
     ) -> "PaginatedResult[T]":
         """
         get a full list that will be returned in parts
         `slug` is the key in the JSON response that is to be concatenated
+        `prefetch` is the number of pages that are requested ahead in the background
         """
         
         if not t:
             t = cast(Callable[[JSONData], T], lambda x: x)
         
-        return PaginatedResult(self, method, slug, *args, params=params, t=t, **kwargs)
+        return PaginatedResult(self, method, slug, *args, params=params, t=t, prefetch=prefetch, **kwargs)
+    
+    def clear_cache(self) -> None:
+        "forget all images, tags and filters loaded so far"
+        
+        self._image_cache.cache_clear()
+        self._tag_cache.cache_clear()
+        self._filter_cache.cache_clear()
     
     def get_image(self, image_id: int) -> Image:
         "load details for a given image_id"
         
+        return Image(copy.deepcopy(self._image_cache(image_id)))
+    
+    def _fetch_image_raw(self, image_id: int) -> JSONObject:
         response = self.api_call(f"images/{image_id:d}")
         response.raise_for_status()
-        return Image(response.json()["image"])
+        return cast(JSONObject, _decode_json(response.content)["image"])
     
     def get_tag(self, tag_slug: str) -> Tag:
         "load details for a given slug"
         
         self.validate_tag_slug(tag_slug)
         
+        return Tag(copy.deepcopy(self._tag_cache(tag_slug)))
+    
+    def _fetch_tag_raw(self, tag_slug: str) -> JSONObject:
         response = self.api_call(f"tags/{urllib.parse.quote(tag_slug)}")
         response.raise_for_status()
-        return Tag(response.json()["tag"])
+        return cast(JSONObject, _decode_json(response.content)["tag"])
     
     SLUG_LOOKUPS = {
         ".": "dot",
@@ -69,19 +237,36 @@ class Site:
     }
     SLUG_ESCAPES = list(SLUG_LOOKUPS.values())
     OPTIONAL_ESCAPES = "'()"
+    _SLUG_ALNUM = frozenset(string.ascii_lowercase + string.digits + "_")
+    
+    _SLUG_RE = re.compile(
+        r"(?:[a-z0-9_+{}]|-(?:{})-|%[0-9a-fA-F]{{2}})+".format(
+            re.escape(OPTIONAL_ESCAPES),
+            "|".join(SLUG_ESCAPES),
+        )
+    )
     
     @classmethod
     def validate_tag_slug(clz, tag: str) -> bool:
         if not tag:
             raise ValueError("Empty string is not a valid tag")
         
+        if clz._SLUG_RE.fullmatch(tag):
+            return True
+        
+        # only walk the string by hand to find out what exactly is wrong with it
+        clz._diagnose_tag_slug(tag)
+        raise ValueError(f"Invalid tag {tag!r}")
+    
+    @classmethod
+    def _diagnose_tag_slug(clz, tag: str) -> None:
         rest = tag
         while rest:
             c = rest[0]
-            if c in string.ascii_lowercase or c in string.digits:
+            if c in clz._SLUG_ALNUM:
                 rest = rest[1:]
                 continue
-            if c in "_+" or c in clz.OPTIONAL_ESCAPES:
+            if c == "+" or c in clz.OPTIONAL_ESCAPES:
                 rest = rest[1:]
                 continue
             if c in "-":
@@ -105,8 +290,6 @@ class Site:
                 raise ValueError("percent followed by less than two hexdigits")
             
             raise ValueError(f"Invalid character {c!r} in tag {tag!r}")
-        
-        return True
     
     @classmethod
     def tag_to_slug(clz, name: str, optional_escapes: bool = False) -> str:
@@ -117,29 +300,34 @@ class Site:
         You have to check for each which version to apply. :-(
         """
         
-        slug = ""
+        alnum = clz._SLUG_ALNUM
+        lookups = clz.SLUG_LOOKUPS
+        quote = urllib.parse.quote
+        
+        parts: List[str] = []
         for c in name.lower():
-            if c in string.ascii_lowercase or c in string.digits:
-                slug += c
-            elif c in "_":
-                slug += c
+            if c in alnum:
+                parts.append(c)
             elif c in clz.OPTIONAL_ESCAPES:
                 # optional escapes - might be replaced, but we can't say for sure :(
-                slug += urllib.parse.quote(c) if optional_escapes else c
+                parts.append(quote(c) if optional_escapes else c)
             elif c == " ":
-                slug += "+"
-            elif c in clz.SLUG_LOOKUPS:
-                slug += "-{}-".format(clz.SLUG_LOOKUPS[c])
+                parts.append("+")
+            elif c in lookups:
+                parts.append("-{}-".format(lookups[c]))
             else:
-                slug += urllib.parse.quote(c)
-        return slug
+                parts.append(quote(c))
+        return "".join(parts)
     
     def get_filter(self, filter_id: int) -> Filter:
         "load details for a given filter_id"
         
+        return Filter(copy.deepcopy(self._filter_cache(filter_id)))
+    
+    def _fetch_filter_raw(self, filter_id: int) -> JSONObject:
         response = self.api_call(f"filters/{filter_id:d}")
         response.raise_for_status()
-        return Filter(response.json()["filter"])
+        return cast(JSONObject, _decode_json(response.content)["filter"])
     
     def search_images(
         self,
@@ -152,90 +340,172 @@ class Site:
     ) -> "PaginatedResult[Image]":
         "search for images matching a query. returns an iterable of images."
         
-        params: Dict[str, Any] = {"q": query}
-        if sort_field:
-            params["sf"] = sort_field
-        if sort_direction:
-            params["sd"] = sort_direction
-        if filter_id is not None:
-            params["filter_id"] = int(filter_id)
-        if per_page:
-            params["per_page"] = int(per_page)
-        if key is not None:
-            params["key"] = key
-        
+        params = _search_params(query, per_page, self.default_per_page, sort_field, sort_direction, filter_id, key)
         return self.api_call_paginated("search/images", "images", params=params, t=Image)
     
     def search_tags(self, query: str, per_page: Optional[int] = None) -> "PaginatedResult[Tag]":
         "search for tags matching a query. returns an iterable of tags."
         
-        params: Dict[str, Any] = {"q": query}
-        if per_page:
-            params["per_page"] = int(per_page)
+        params = _search_params(query, per_page, self.default_per_page)
         return self.api_call_paginated("search/tags", "tags", params=params, t=Tag)
     
     def search_filters(self, query: str, per_page: Optional[int] = None) -> "PaginatedResult[Filter]":
         "search for filters matching a query. returns an iterable of filters."
         
-        params: Dict[str, Any] = {"q": query}
-        if per_page:
-            params["per_page"] = int(per_page)
+        params = _search_params(query, per_page, self.default_per_page)
         return self.api_call_paginated("search/filters", "filters", params=params, t=Filter)
 
 
-class PaginatedResult(Iterator[T], Generic[T]):
-    results: List[JSONData]
+class _Pagination(Generic[T]):
+    """
+    the bookkeeping shared by `PaginatedResult` and `AsyncPaginatedResult`:
+    which page comes next, when iteration ends and which pages may be prefetched.
+    the subclasses only load the pages.
+    """
+    
+    results: Deque[T]
     total: int
+    page_size: Optional[int]
     
     def __init__(
         self,
-        site: Site,
         method: str,
         slug: str,
-        *args: Any,
-        params: Dict[str, Any] = {},
+        args: Tuple[Any, ...],
+        params: Optional[Dict[str, Any]],
         t: Optional[Callable],
-        **kwargs: Any,
+        prefetch: int,
+        kwargs: Dict[str, Any],
     ):
-        self.site = site
         self.method = method
         self.slug = slug
-        self.params = params
-        self.t = t if t else lambda x: x
+        # every paginator owns its params, they are updated while iterating
+        self.params = dict(params) if params else {}
+        # `page` is the last page loaded, so iteration starts with the given page, or the first one
+        self.params["page"] = int(self.params.get("page", 1)) - 1
+        self.t = cast(Callable[[JSONData], T], t if t else lambda x: x)
+        self.prefetch = max(prefetch, 0)
         self.args = args
         self.kwargs = kwargs
         
-        self.results = []
-        self.fetch_next()
+        self.results = deque()
+        self.page_size = None
+        self._exhausted = False
+        # the last page that was requested, either loaded already or prefetching
+        self._scheduled = self.page
     
     @property
     def page(self) -> int:
-        return int(self.params.get("page", 1))
+        "the last page loaded, 0 before the first one"
+        
+        return int(self.params["page"])
+    
+    @property
+    def last_page(self) -> Optional[int]:
+        """
+        the last page that holds results, estimated from `total` and the size of the pages returned so far.
+        only used to limit prefetching, iteration ends with the first empty page.
+        """
+        
+        if not self.page_size:
+            return None
+        return -(-self.total // self.page_size)
+    
+    def _page_params(self, page: int) -> Dict[str, Any]:
+        return dict(self.params, page=page)
+    
+    def _parse_page(self, content: bytes) -> Tuple[List[T], int]:
+        "the items of a page, already converted, and the reported total"
+        
+        data = _decode_json(content)
+        return list(map(self.t, data[self.slug])), data["total"]
+    
+    def _add_page(self, page: int, items: List[T], total: int) -> None:
+        "store the next page, an empty one ends the iteration"
+        
+        self.total = total
+        self.params["page"] = page
+        self._scheduled = max(self._scheduled, page)
+        if not items:
+            self._exhausted = True
+            return
+        
+        self.results.extend(items)
+        
+        # the server may return fewer items than requested, Philomena caps `per_page` at 50
+        self.page_size = max(self.page_size or 0, len(items))
+    
+    def _pages_to_prefetch(self, pending: int) -> Iterator[int]:
+        "the pages that top up the prefetch window of `pending` pages, without going beyond the last one"
+        
+        last_page = self.last_page
+        if self._exhausted or last_page is None:
+            return
+        
+        while pending < self.prefetch and self._scheduled < last_page:
+            self._scheduled += 1
+            pending += 1
+            yield self._scheduled
+
+
+class PaginatedResult(_Pagination[T], Iterator[T]):
+    def __init__(
+        self,
+        site: Site,
+        method: str,
+        slug: str,
+        *args: Any,
+        params: Optional[Dict[str, Any]] = None,
+        t: Optional[Callable],
+        prefetch: int = 3,
+        **kwargs: Any,
+    ):
+        super().__init__(method, slug, args, params, t, prefetch, kwargs)
+        self.site = site
+        
+        # up to `prefetch` pages are requested in the background while the current one is consumed
+        self._executor = ThreadPoolExecutor(max_workers=max(self.prefetch, 1))
+        self._pending: "Deque[Future[Tuple[List[T], int]]]" = deque()
+        
+        self.fetch_next()
     
     def __next__(self) -> T:
         if not self.results:
             self.fetch_next()
             if not self.results:
+                self.close()
                 raise StopIteration
         
-        t = cast(Callable[[JSONData], T], self.t)
-        return t(self.results.pop(0))
+        return self.results.popleft()
+    
+    def close(self) -> None:
+        "stop prefetching further pages"
+        
+        while self._pending:
+            self._pending.popleft().cancel()
+        self._executor.shutdown(wait=False)
     
     def fetch_next(self) -> None:
-        self.params["page"] = self.page + 1
+        if self._exhausted:
+            return
         
-        pause = 2
-        while True:
-            response = self.site.api_call(self.method, *self.args, params=self.params, **self.kwargs)
-            if response.status_code != 429:
-                break
-            time.sleep(pause)
-            pause *= 2
+        page = self.page + 1
+        if self._pending:
+            items, total = self._pending.popleft().result()
+        else:
+            items, total = self._fetch_page(page)
+        self._add_page(page, items, total)
         
+        for page in self._pages_to_prefetch(len(self._pending)):
+            self._pending.append(self._executor.submit(self._fetch_page, page))
+    
+    def _fetch_page(self, page: int) -> Tuple[List[T], int]:
+        """
+        load a single page and return its items, already converted, and the reported total.
+        does not modify `self`, so it can be run from the prefetch threads.
+        """
+        
+        response = self.site.api_call(self.method, *self.args, params=self._page_params(page), **self.kwargs)
         response.raise_for_status()
         
-        data = response.json()
-        self.total = data["total"]
-        self.results += data[self.slug]
-    
-
+        return self._parse_page(response.content)
@@ -5,37 +5,72 @@ Ported from https://github.com/philomena-dev/philomena/blob/master/assets/js/mat
 """
 
 import abc
-import dateutil.parser
+import enum
+import functools
 import re
-import Levenshtein
 import math
 import time
 
+from collections import deque
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
-from typing import cast, Callable, Iterable, List, Optional, Sequence, Tuple, Union
+from rapidfuzz.distance import Levenshtein
+from typing import (
+    cast, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union, overload,
+)
 
 from . import api, utils
 from .types import Image, Interaction
 
-__all__ = ["parse_search", "ParseError"]
-
-TOKEN_LIST: Sequence[Tuple[str, re.Pattern]] = (
-    ('fuzz', re.compile(r"^~(?:\d+(\.\d+)?|\.\d+)")),
-    ('boost', re.compile(r"^\^[-+]?\d+(\.\d+)?")),
-    ('quoted_lit', re.compile(r'^\s*"(?:[^"]|\\")+"')),
-    ('lparen', re.compile(r"^\s*\(\s*")),
-    ('rparen', re.compile(r"^\s*\)\s*")),
-    ('and_op', re.compile(r"^\s*(?:&&|AND)\s+")),
-    ('and_op', re.compile(r"^\s*,\s*")),
-    ('or_op', re.compile(r"^\s*(?:\|\||OR)\s+")),
-    ('not_op', re.compile(r"^\s*NOT(?:\s+|(?=\())")),
-    ('not_op', re.compile(r"^\s*[!-]\s*")),
-    ('space', re.compile(r"^\s+")),
-    ('word', re.compile(r"^(?:[^\s,()^~]|\\[\s,()^~])+")),
-    ('word', re.compile(r"^(?:[^\s,()]|\\[\s,()])")),
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+__all__ = ["parse_search", "ParseError", "ImageBatch", "InteractionIndex"]
+
+
+class TokenType(enum.IntEnum):
+    FUZZ = 0
+    BOOST = 1
+    QUOTED_LIT = 2
+    LPAREN = 3
+    RPAREN = 4
+    AND = 5
+    OR = 6
+    NOT = 7
+    SPACE = 8
+    WORD = 9
+
+
+TOKEN_LIST: Sequence[Tuple[TokenType, re.Pattern]] = (
+    (TokenType.FUZZ, re.compile(r"~(?:\d+(\.\d+)?|\.\d+)")),
+    (TokenType.BOOST, re.compile(r"\^[-+]?\d+(\.\d+)?")),
+    (TokenType.QUOTED_LIT, re.compile(r'\s*"(?:[^"]|\\")+"')),
+    (TokenType.LPAREN, re.compile(r"\s*\(\s*")),
+    (TokenType.RPAREN, re.compile(r"\s*\)\s*")),
+    (TokenType.AND, re.compile(r"\s*(?:&&|AND)\s+")),
+    (TokenType.AND, re.compile(r"\s*,\s*")),
+    (TokenType.OR, re.compile(r"\s*(?:\|\||OR)\s+")),
+    (TokenType.NOT, re.compile(r"\s*NOT(?:\s+|(?=\())")),
+    (TokenType.NOT, re.compile(r"\s*[!-]\s*")),
+    (TokenType.SPACE, re.compile(r"\s+")),
+    (TokenType.WORD, re.compile(r"(?:[^\s,()^~]|\\[\s,()^~])+")),
+    (TokenType.WORD, re.compile(r"(?:[^\s,()]|\\[\s,()])")),
 )
 
+# All token patterns fused into one alternation, so each position only enters the regex engine once.
+# Alternatives are tried in order, which keeps the priorities of TOKEN_LIST.
+# Token types may occur more than once, so every group is numbered and mapped back.
+TOKEN_RE = re.compile("|".join(
+    f"(?P<{token_type.name}{i}>{token_re.pattern})"
+    for i, (token_type, token_re) in enumerate(TOKEN_LIST)
+))
+TOKEN_GROUPS: Dict[str, TokenType] = {
+    f"{token_type.name}{i}": token_type
+    for i, (token_type, token_re) in enumerate(TOKEN_LIST)
+}
+
 
 NUMBER_FIELDS = (
     'id', 'width', 'height', 'aspect_ratio', 'comment_count',
@@ -48,14 +83,222 @@ LITERAL_FIELDS = (
     'score', 'uploader', 'source_url', 'description',
 )
 
+_RANGE_FIELD_RE = re.compile(r"^(\w+)\.([lg]te?|eq)$")
+_RELATIVE_DATE_RE = re.compile(r"(\d+) (second|minute|hour|day|week|month|year)s? ago")
+_TZ_RE = re.compile(r"([+-])(\d{2}):(\d{2})$")
+_DATE_PARSE_RES = (
+    re.compile(r"^(\d{4})"),
+    re.compile(r"^-(\d{2})"),
+    re.compile(r"^-(\d{2})"),
+    re.compile(r"^(?:\s+|T|t)(\d{2})"),
+    re.compile(r"^:(\d{2})"),
+    re.compile(r"^:(\d{2})"),
+)
+_DATE_DELTAS = (
+    relativedelta(years=1),
+    relativedelta(months=1),
+    relativedelta(days=1),
+    relativedelta(hours=1),
+    relativedelta(minutes=1),
+    relativedelta(seconds=1),
+)
+_QUOTED_RE = re.compile(r'^"([^"]|\\")+"$')
+_UNESCAPE_RE = re.compile(r"\\(\\|[^*?])")
+_WILDCARD_ESCAPES = {ch: "\\" + ch for ch in ".+^$[]\\(){}|-*?"}
+
+# parsed terms keyed on (raw_term, fuzz, boost), parsing the same term twice yields the same result
+_PARSED_TERM_CACHE: Dict[Tuple[str, Optional[float], Optional[float]], Tuple[Any, ...]] = {}
+_PARSED_TERM_CACHE_SIZE = 4096
+
+
+def _unescape(match: "re.Match[str]") -> str:
+    return match[0] if match[1] == "\\" else match[1]
+
 
 class ParseError(ValueError):
     pass
 
 
+class InteractionIndex(Sequence[Interaction]):
+    """
+    interactions along with a map from (interaction_type, value) to the ids of all images with such an interaction,
+    (interaction_type, None) maps to all images with this type of interaction, regardless of its value.
+    
+    matching one user's interactions against many images should build the index once and pass it to every match():
+    
+        interactions = InteractionIndex(interactions)
+        for image in images:
+            query.match(image, interactions)
+    
+    a plain sequence of interactions is scanned for every my: term instead.
+    the index is built on first use and does not notice later changes to the interactions, wrap them again then.
+    """
+    
+    def __init__(self, interactions: Sequence[Interaction]):
+        self.interactions = interactions
+        self._index: Optional[Dict[Tuple[str, Optional[str]], Set[int]]] = None
+    
+    @overload
+    def __getitem__(self, i: int) -> Interaction:
+        ...
+    
+    @overload
+    def __getitem__(self, i: slice) -> Sequence[Interaction]:
+        ...
+    
+    def __getitem__(self, i: Union[int, slice]) -> Union[Interaction, Sequence[Interaction]]:
+        return self.interactions[i]
+    
+    def __len__(self) -> int:
+        return len(self.interactions)
+    
+    def _build(self) -> Dict[Tuple[str, Optional[str]], Set[int]]:
+        index: Dict[Tuple[str, Optional[str]], Set[int]] = {}
+        for v in self.interactions:
+            index.setdefault((v.interaction_type, None), set()).add(v.image_id)
+            index.setdefault((v.interaction_type, v.value), set()).add(v.image_id)
+        return index
+    
+    def image_ids(self, interaction_type: str, value: Optional[str]) -> Set[int]:
+        if self._index is None:
+            self._index = self._build()
+        
+        return self._index.get((interaction_type, value), set())
+
+
+def _index_interactions(interactions: Optional[Sequence[Interaction]]) -> Optional[Sequence[Interaction]]:
+    "wrap `interactions` in an `InteractionIndex`, unless it is one already"
+    
+    if interactions is None or isinstance(interactions, InteractionIndex):
+        return interactions
+    return InteractionIndex(interactions)
+
+
+@functools.lru_cache(maxsize=4096)
+def _compile_wildcard(term: str) -> re.Pattern:
+    """
+    Transforms wildcard match into regular expression.
+    A custom NFA with caching may be more sophisticated but not
+    likely to be faster.
+    """
+    
+    return re.compile(_translate_wildcard(term))
+
+
+def _scan_wildcard(term: str) -> Iterator[Tuple[str, bool]]:
+    """
+    split a normalized wildcard term into its characters and whether each of them is a wildcard.
+    a backslash only escapes a following `*`, `?` or backslash, any other backslash is literal.
+    """
+    
+    escaped = False
+    for ch in term:
+        if escaped:
+            escaped = False
+            if ch in "*?\\":
+                yield ch, False
+                continue
+            # the backslash does not escape anything, so it is literal
+            yield "\\", False
+        
+        if ch == "\\":
+            escaped = True
+        else:
+            yield ch, ch in "*?"
+    
+    if escaped:
+        yield "\\", False
+
+
+def _translate_wildcard(term: str) -> str:
+    """
+    translate a wildcard term into an anchored regular expression in a single pass.
+    `*` matches any number of characters and `?` at most one.
+    """
+    
+    parts = ["^"]
+    for ch, wildcard in _scan_wildcard(term):
+        if not wildcard:
+            parts.append(_WILDCARD_ESCAPES.get(ch, ch))
+        elif ch == "*":
+            parts.append(".*")
+        else:
+            parts.append(".?")
+    parts.append("$")
+    
+    return "".join(parts)
+
+
+def _wildcard_literal(term: str) -> Optional[str]:
+    "the unescaped term if it contains no wildcards, so it can be matched exactly"
+    
+    chars = []
+    for ch, wildcard in _scan_wildcard(term):
+        if wildcard:
+            return None
+        chars.append(ch)
+    
+    return "".join(chars)
+
+
+class ImageBatch:
+    """
+    a fixed list of images to be matched all at once, see `SearchOperand.match_batch()`.
+    number fields are turned into numpy arrays on first use, so they can be compared in one go.
+    """
+    
+    def __init__(self, images: Iterable[Image]):
+        if np is None:
+            raise ImportError("ImageBatch requires numpy")
+        
+        self.images = list(images)
+        self._columns: Dict[str, "np.ndarray"] = {}
+    
+    def __len__(self) -> int:
+        return len(self.images)
+    
+    def column(self, field: str) -> "np.ndarray":
+        "the values of a number field for all images"
+        
+        try:
+            return self._columns[field]
+        except KeyError:
+            pass
+        
+        column = np.fromiter(
+            (float(getattr(image, field)) for image in self.images),
+            dtype=np.float64,
+            count=len(self.images),
+        )
+        self._columns[field] = column
+        return column
+    
+    def select(self, mask: "np.ndarray") -> List[Image]:
+        "the images for which `mask` is true"
+        
+        return [self.images[i] for i in np.flatnonzero(mask)]
+
+
 class SearchOperand(abc.ABC):
     @abc.abstractmethod
     def match(self, target: Image, interactions: Optional[Sequence[Interaction]] = None) -> bool:
+        "match a single image, pass an `InteractionIndex` when matching the same interactions against many images"
+        raise NotImplementedError
+    
+    def match_batch(self, batch: ImageBatch, interactions: Optional[Sequence[Interaction]] = None) -> "np.ndarray":
+        "match all images of a batch and return a boolean array"
+        
+        interactions = _index_interactions(interactions)
+        return np.fromiter(
+            (self.match(image, interactions) for image in batch.images),
+            dtype=bool,
+            count=len(batch),
+        )
+    
+    @property
+    @abc.abstractmethod
+    def cost(self) -> int:
+        "a rough estimate of how expensive match() is, so cheaper operands can be evaluated first"
         raise NotImplementedError
 
 
@@ -68,6 +311,8 @@ class SearchTerm(SearchOperand):
     def __init__(self, term: str):
         self.term = self.raw_term = term.strip()
         self.parsed = False
+        self.expires: Optional[float] = None
+        self.term_lower: Optional[str] = None
         self.fuzz = None
         self.boost = None
         self.wildcardable = False
@@ -76,6 +321,18 @@ class SearchTerm(SearchOperand):
         clzname = utils.get_class_name(type(self))
         return f"{clzname}({self.raw_term!r})"
     
+    @property
+    def cost(self) -> int:
+        # estimated from the raw term, so the term does not have to be parsed yet
+        if self.fuzz:
+            return 8
+        field, sep, _ = self.raw_term.partition(":")
+        if sep and self.parse_range_field(field):
+            return 1
+        if not _QUOTED_RE.match(self.raw_term) and _wildcard_literal(self.raw_term) is None:
+            return 4
+        return 2
+    
     def append(self, substr: str) -> None:
         self.raw_term += substr
         self.term = self.raw_term
@@ -88,7 +345,7 @@ class SearchTerm(SearchOperand):
         if field in DATE_FIELDS:
             return (field, "eq", "date")
         
-        match = re.match(r"^(\w+)\.([lg]te?|eq)$", field)
+        match = _RANGE_FIELD_RE.match(field)
         if match:
             if match[1] in NUMBER_FIELDS:
                 return (match[1], match[2], "number")
@@ -98,7 +355,14 @@ class SearchTerm(SearchOperand):
         return None
     
     def parse_relative_date(self, date_val: str, qual: str) -> Tuple[Union[datetime, Tuple[datetime, datetime]], str]:
-        match = re.search(r"(\d+) (second|minute|hour|day|week|month|year)s? ago", date_val)
+        """
+        parse dates like "3 days ago".
+        like Elasticsearch's `now/h`, the current time is rounded down to the hour (or to the unit, if it is shorter),
+        so e.g. "3 hours ago" is the hour from three to two full hours ago.
+        the term stays valid until the next boundary and is cached until then.
+        """
+        
+        match = _RELATIVE_DATE_RE.search(date_val)
         bounds = {
             "second": 1,
             "minute": 60,
@@ -115,7 +379,9 @@ class SearchTerm(SearchOperand):
         amount = int(match[1], 10)
         scale = bounds[match[2]]
         
-        now = time.time()
+        granularity = min(scale, 3600)
+        now = time.time() // granularity * granularity
+        self.expires = now + granularity
         bottom_date = datetime.fromtimestamp(now - (amount * scale), tz=timezone.utc).astimezone()
         top_date = datetime.fromtimestamp(now - ((amount - 1) * scale), tz=timezone.utc).astimezone()
         
@@ -127,15 +393,6 @@ class SearchTerm(SearchOperand):
         return ((bottom_date, top_date), "eq")
     
     def parse_absolute_date(self, date_val: str, qual: str) -> Tuple[Union[datetime, Tuple[datetime, datetime]], str]:
-        PARSE_RES = [
-            re.compile(r"^(\d{4})"),
-            re.compile(r"^-(\d{2})"),
-            re.compile(r"^-(\d{2})"),
-            re.compile(r"^(?:\s+|T|t)(\d{2})"),
-            re.compile(r"^:(\d{2})"),
-            re.compile(r"^:(\d{2})"),
-        ]
-        
         if not date_val:
             raise ParseError("Empty term")
         
@@ -144,7 +401,7 @@ class SearchTerm(SearchOperand):
         orig_date_val = date_val
         local_date_val = date_val
         
-        match = re.search(r"([+-])(\d{2}):(\d{2})$", local_date_val)
+        match = _TZ_RE.search(local_date_val)
         if match:
             timezone_offset[0] = int(match[2], 10)
             timezone_offset[1] = int(match[3], 10)
@@ -157,7 +414,7 @@ class SearchTerm(SearchOperand):
         elif local_date_val[-1].lower() == "z":
             local_date_val = local_date_val[:-1]
         
-        for i, regex in enumerate(PARSE_RES):
+        for i, regex in enumerate(_DATE_PARSE_RES):
             if not local_date_val:
                 i -= 1
                 break
@@ -183,15 +440,7 @@ class SearchTerm(SearchOperand):
             tzinfo=tz,
         )
         
-        DELTAS = (
-            relativedelta(years=1),
-            relativedelta(months=1),
-            relativedelta(days=1),
-            relativedelta(hours=1),
-            relativedelta(minutes=1),
-            relativedelta(seconds=1),
-        )
-        delta = DELTAS[i]
+        delta = _DATE_DELTAS[i]
         
         if qual == "lte":
             return (time_obj + delta, "lt")
@@ -215,9 +464,30 @@ class SearchTerm(SearchOperand):
     def parse(self) -> None:
         if self.parsed:
             return
+        
+        key = (self.raw_term, self.fuzz, self.boost)
+        cached = _PARSED_TERM_CACHE.get(key)
+        if cached is not None and (cached[-1] is None or cached[-1] > time.time()):
+            (self.term, self.compare, self.term_space, self.term_type,
+             self.wildcardable, self.term_lower, self.expires) = cached
+            self.parsed = True
+            return
+        
+        self._parse()
+        
+        # relative dates are only shared until they expire
+        if len(_PARSED_TERM_CACHE) >= _PARSED_TERM_CACHE_SIZE:
+            _PARSED_TERM_CACHE.clear()
+        _PARSED_TERM_CACHE[key] = (
+            self.term, getattr(self, "compare", None), self.term_space, self.term_type,
+            self.wildcardable, self.term_lower, self.expires,
+        )
+    
+    def _parse(self) -> None:
         self.term = self.raw_term
+        self.expires = None
         
-        self.wildcardable = not self.fuzz and not re.match(r'^"([^"]|\\")+"$', self.term)
+        self.wildcardable = not self.fuzz and not _QUOTED_RE.match(self.term)
         
         if not self.wildcardable and not self.fuzz:
             self.term = self.term[1:-1]
@@ -257,18 +527,16 @@ class SearchTerm(SearchOperand):
                 self.term_space = term_candidate
         
         if self.wildcardable:
-            # Transforms wildcard match into regular expression.
-            # A custom NFA with caching may be more sophisticated but not
-            # likely to be faster.
-            term = cast(str, self.term)
-            
-            term = re.sub(r"([.+^$[\]\\(){}|-])", r'\\\1', term)
-            term = re.sub(r"([^\\]|[^\\](?:\\\\)+)\*", r'\1.*', term)
-            term = re.sub(r"^(?:\\\\)*\*", '.*', term)
-            term = re.sub(r"([^\\]|[^\\](?:\\\\)+)\?", r'\1.?', term)
-            term = re.sub(r"^(?:\\\\)*\?", '.?', term)
-            
-            self.term = re.compile(f"^{term}$", flags=re.I)
+            literal = _wildcard_literal(cast(str, self.term))
+            if literal is None:
+                # targets are lowered before matching, which is cheaper than a case insensitive regex
+                self.term = _compile_wildcard(cast(str, self.term).lower())
+            else:
+                # without any wildcards the term is matched exactly, which is a single lookup for tags
+                self.term = literal
+                self.wildcardable = False
+        
+        self.term_lower = self.term.lower() if isinstance(self.term, str) else None
         
         self.parsed = True
     
@@ -277,9 +545,12 @@ class SearchTerm(SearchOperand):
         if not self.wildcardable:
             return term
         
-        return re.sub(r"\\([^*?])", r"\1", term)
+        # escaped backslashes stay escaped, so the wildcard translation does not see them as escapes of their own
+        return _UNESCAPE_RE.sub(_unescape, term)
     
     def fuzzy_match(self, target_str: str) -> bool:
+        "`target_str` must already be in lower case"
+        
         if not isinstance(self.term, str):
             raise TypeError("self.term is not a str")
         
@@ -291,17 +562,28 @@ class SearchTerm(SearchOperand):
         else:
             target_distance = 0
         
-        distance = Levenshtein.distance(self.term, target_str.lower())
+        # the distance is an integer, so this cutoff is exact and lets rapidfuzz stop early
+        cutoff = int(target_distance)
+        
+        # the distance is at least the difference in length, no need to compute it then
+        if abs(len(target_str) - len(self.term)) > cutoff:
+            return False
+        
+        distance = Levenshtein.distance(self.term, target_str, score_cutoff=cutoff)
         
-        return distance <= target_distance
+        return distance <= cutoff
     
     def exact_match(self, target_str: str) -> bool:
+        "`target_str` must already be in lower case"
+        
         if not isinstance(self.term, str):
             raise TypeError("self.term is not a str")
         
-        return self.term.lower() == target_str.lower()
+        return self.term_lower == target_str
     
     def wildcard_match(self, target_str: str) -> bool:
+        "`target_str` must already be in lower case"
+        
         if not isinstance(self.term, re.Pattern):
             raise TypeError("self.term is not a regex")
         
@@ -314,18 +596,28 @@ class SearchTerm(SearchOperand):
         interaction: Optional[str],
         interactions: Sequence[Interaction],
     ) -> bool:
+        if isinstance(interactions, InteractionIndex):
+            return image_id in interactions.image_ids(type, interaction)
+        
+        # building an index for a single image would take longer than a scan
         return any(
             v.image_id == image_id and v.interaction_type == type and (interaction is None or v.value == interaction)
             for v in interactions
         )
     
     def match(self, target: Image, interactions: Optional[Sequence[Interaction]] = None) -> bool:
+        if self.expires is not None and self.expires <= time.time():
+            self.parsed = False
         if not self.parsed:
             self.parse()
         
         comp_func: Callable[[str], bool]
         
         if self.term_type == "literal":
+            if self.term_space == "tags" and not self.fuzz and not self.wildcardable:
+                # a plain tag name is a single hash lookup
+                return self.term_lower in target.tags_lower
+            
             if self.fuzz:
                 comp_func = self.fuzzy_match
             elif self.wildcardable:
@@ -333,9 +625,10 @@ class SearchTerm(SearchOperand):
             else:
                 comp_func = self.exact_match
             
+            # all comparison functions expect the target in lower case
             if self.term_space == "tags":
-                return any(comp_func(tag) for tag in target.tags)
-            return comp_func(getattr(target, self.term_space))
+                return any(comp_func(tag) for tag in target.tags_lower)
+            return comp_func(getattr(target, self.term_space).lower())
         
         if self.term_type == "my":
             # Should work with most my:conditions except watched.
@@ -355,7 +648,7 @@ class SearchTerm(SearchOperand):
             return False
         
         if self.term_type == "date":
-            date = dateutil.parser.isoparse(getattr(target, self.term_space))
+            date = target.get_datetime(self.term_space)
             # The open-left, closed-right date range specified by the
             # date/time format limits the types of comparisons that are
             # done compared to numeric ranges.
@@ -385,195 +678,270 @@ class SearchTerm(SearchOperand):
         if self.compare == "gte":
             return number >= term
         return term == number
+    
+    def match_batch(self, batch: ImageBatch, interactions: Optional[Sequence[Interaction]] = None) -> "np.ndarray":
+        if self.expires is not None and self.expires <= time.time():
+            self.parsed = False
+        if not self.parsed:
+            self.parse()
+        
+        if self.term_type != "number":
+            return super().match_batch(batch, interactions)
+        
+        # NaN compares false to everything, just like in match()
+        numbers = batch.column(self.term_space)
+        term = cast(float, self.term)
+        
+        if self.fuzz:
+            return (term <= numbers + self.fuzz) & (term + self.fuzz >= numbers)
+        
+        if self.compare == "lt":
+            return numbers < term
+        if self.compare == "gt":
+            return numbers > term
+        if self.compare == "lte":
+            return numbers <= term
+        if self.compare == "gte":
+            return numbers >= term
+        return np.equal(numbers, term)
 
 
 class NotOperator(SearchOperand):
     def __init__(self, op: SearchOperand):
         self.op = op
+        self._cost = op.cost
     
     def __repr__(self) -> str:
         clzname = utils.get_class_name(type(self))
         return f"{clzname}({self.op!r})"
     
+    @property
+    def cost(self) -> int:
+        return self._cost
+    
     def match(self, target: Image, interactions: Optional[Sequence[Interaction]] = None) -> bool:
         return not self.op.match(target, interactions)
+    
+    def match_batch(self, batch: ImageBatch, interactions: Optional[Sequence[Interaction]] = None) -> "np.ndarray":
+        return np.logical_not(self.op.match_batch(batch, _index_interactions(interactions)))
 
 
 class AndOperator(SearchOperand):
     def __init__(self, op1: SearchOperand, op2: SearchOperand):
         self.op1 = op1
         self.op2 = op2
+        self._cost = op1.cost + op2.cost
     
     def __repr__(self) -> str:
         clzname = utils.get_class_name(type(self))
         return f"{clzname}({self.op1!r}, {self.op2!r})"
     
+    @property
+    def cost(self) -> int:
+        return self._cost
+    
     def match(self, target: Image, interactions: Optional[Sequence[Interaction]] = None) -> bool:
         return self.op1.match(target, interactions) and self.op2.match(target, interactions)
+    
+    def match_batch(self, batch: ImageBatch, interactions: Optional[Sequence[Interaction]] = None) -> "np.ndarray":
+        interactions = _index_interactions(interactions)
+        return self.op1.match_batch(batch, interactions) & self.op2.match_batch(batch, interactions)
 
 
 class OrOperator(SearchOperand):
     def __init__(self, op1: SearchOperand, op2: SearchOperand):
         self.op1 = op1
         self.op2 = op2
+        self._cost = op1.cost + op2.cost
     
     def __repr__(self) -> str:
         clzname = utils.get_class_name(type(self))
         return f"{clzname}({self.op1!r}, {self.op2!r})"
     
+    @property
+    def cost(self) -> int:
+        return self._cost
+    
     def match(self, target: Image, interactions: Optional[Sequence[Interaction]] = None) -> bool:
         return self.op1.match(target, interactions) or self.op2.match(target, interactions)
+    
+    def match_batch(self, batch: ImageBatch, interactions: Optional[Sequence[Interaction]] = None) -> "np.ndarray":
+        interactions = _index_interactions(interactions)
+        return self.op1.match_batch(batch, interactions) | self.op2.match_batch(batch, interactions)
 
 
-def generate_lex_array(search_str: str) -> List[Union[SearchTerm, str]]:
-    op_queue: List[str] = []
+def generate_lex_array(search_str: str) -> List[Union[SearchTerm, TokenType]]:
+    op_queue: Deque[TokenType] = deque()
     group_negate: List[bool] = []
-    token_stack: List[Union[SearchTerm, str]] = []
+    token_stack: List[Union[SearchTerm, TokenType]] = []
     search_term: Optional[SearchTerm] = None
     boost: Optional[float] = None
     fuzz: Optional[float] = None
     lparen_ctr: int = 0
     negate: bool = False
     boost_fuzz_str: str = ""
-    local_search_str: str = search_str
+    pos: int = 0
+    end: int = len(search_str)
     
-    while local_search_str:
-        for token_name, token_re in TOKEN_LIST:
-            match = token_re.match(local_search_str)
-            
-            if match:
-                match_str = match[0]
-                
-                if search_term and (
-                    token_name in ("and_op", "or_op") or token_name == "rparen" and lparen_ctr == 0
-                ):
-                    # Set options.
-                    search_term.boost = boost
-                    search_term.fuzz = fuzz
-                    # Push to stack
-                    token_stack.append(search_term)
-                    # Reset term and options data.
-                    search_term = None
-                    fuzz = None
+    while pos < end:
+        # match() is anchored at `pos`, so the string never has to be sliced
+        match = TOKEN_RE.match(search_str, pos)
+        
+        if not match:
+            # cannot happen, the last word pattern accepts any other single character
+            raise ParseError(f"Unexpected character at position {pos}")
+        
+        token_type = TOKEN_GROUPS[cast(str, match.lastgroup)]
+        match_str = match[0]
+        
+        if search_term and (
+            token_type in (TokenType.AND, TokenType.OR) or token_type is TokenType.RPAREN and lparen_ctr == 0
+        ):
+            # Set options.
+            search_term.boost = boost
+            search_term.fuzz = fuzz
+            # Push to stack
+            token_stack.append(search_term)
+            # Reset term and options data.
+            search_term = None
+            fuzz = None
+            boost = None
+            boost_fuzz_str = ""
+            lparen_ctr = 0
+            if negate:
+                token_stack.append(TokenType.NOT)
+                negate = False
+        
+        if token_type is TokenType.AND:
+            while op_queue and op_queue[0] is TokenType.AND:
+                token_stack.append(op_queue.popleft())
+            op_queue.appendleft(TokenType.AND)
+        elif token_type is TokenType.OR:
+            while op_queue and (op_queue[0] is TokenType.AND or op_queue[0] is TokenType.OR):
+                token_stack.append(op_queue.popleft())
+            op_queue.appendleft(TokenType.OR)
+        elif token_type is TokenType.NOT:
+            if search_term:
+                # We're already inside a search term, so it does not apply, obv.
+                search_term.append(match_str)
+            else:
+                negate = not negate
+        elif token_type is TokenType.LPAREN:
+            if search_term:
+                # If we are inside the search term, do not error
+                # out just yet; instead, consider it as part of
+                # the search term, as a user convenience.
+                search_term.append(match_str)
+                lparen_ctr += 1
+            else:
+                op_queue.appendleft(TokenType.LPAREN)
+                group_negate.append(negate)
+                negate = False
+        elif token_type is TokenType.RPAREN:
+            if lparen_ctr > 0:
+                if search_term:
+                    search_term.append(match_str)
+                else:
+                    search_term = SearchTerm(match_str)
+                lparen_ctr -= 1
+            else:
+                while op_queue:
+                    op = op_queue.popleft()
+                    if op is TokenType.LPAREN:
+                        break
+                    token_stack.append(op)
+                if group_negate and group_negate.pop():
+                    token_stack.append(TokenType.NOT)
+        elif token_type is TokenType.FUZZ:
+            fuzz = float(match_str[1:])
+            boost_fuzz_str += match_str
+        elif token_type is TokenType.BOOST:
+            if search_term:
+                boost = float(match_str[1:])
+                boost_fuzz_str += match_str
+            else:
+                search_term = SearchTerm(match_str)
+        elif token_type is TokenType.QUOTED_LIT:
+            if search_term:
+                search_term.append(match_str)
+            else:
+                search_term = SearchTerm(match_str)
+        elif token_type is TokenType.WORD:
+            if search_term:
+                if fuzz or boost:
                     boost = None
+                    fuzz = None
+                    search_term.append(boost_fuzz_str)
                     boost_fuzz_str = ""
-                    lparen_ctr = 0
-                    if negate:
-                        token_stack.append("not_op")
-                        negate = False
-                
-                if token_name == "and_op":
-                    while op_queue and op_queue[0] == "and_op":
-                        token_stack.append(op_queue.pop(0))
-                    op_queue.insert(0, "and_op")
-                elif token_name == "or_op":
-                    while op_queue and op_queue[0] in ("and_op", "or_op"):
-                        token_stack.append(op_queue.pop(0))
-                    op_queue.insert(0, "or_op")
-                elif token_name == "not_op":
-                    if search_term:
-                        # We're already inside a search term, so it does not apply, obv.
-                        search_term.append(match_str)
-                    else:
-                        negate = not negate
-                elif token_name == "lparen":
-                    if search_term:
-                        # If we are inside the search term, do not error
-                        # out just yet; instead, consider it as part of
-                        # the search term, as a user convenience.
-                        search_term.append(match_str)
-                        lparen_ctr += 1
-                    else:
-                        op_queue.insert(0, "lparen")
-                        group_negate.append(negate)
-                        negate = False
-                elif token_name == "rparen":
-                    if lparen_ctr > 0:
-                        if search_term:
-                            search_term.append(match_str)
-                        else:
-                            search_term = SearchTerm(match_str)
-                        lparen_ctr -= 1
-                    else:
-                        while op_queue:
-                            op = op_queue.pop(0)
-                            if op == "lparen":
-                                break
-                            token_stack.append(op)
-                        if group_negate and group_negate.pop():
-                            token_stack.append("not_op")
-                elif token_name == "fuzz":
-                    fuzz = float(match_str[1:])
-                    boost_fuzz_str += match_str
-                elif token_name == "boost":
-                    if search_term:
-                        boost = float(match_str[1:])
-                        boost_fuzz_str += match_str
-                    else:
-                        search_term = SearchTerm(match_str)
-                elif token_name == "quoted_lit":
-                    if search_term:
-                        search_term.append(match_str)
-                    else:
-                        search_term = SearchTerm(match_str)
-                elif token_name == "word":
-                    if search_term:
-                        if fuzz or boost:
-                            boost = None
-                            fuzz = None
-                            search_term.append(boost_fuzz_str)
-                            boost_fuzz_str = ""
-                        search_term.append(match_str)
-                    else:
-                        search_term = SearchTerm(match_str)
-                else:
-                    # Append extra spaces within search terms.
-                    if search_term:
-                        search_term.append(match_str)
-                
-                # Truncate string and restart the token tests.
-                local_search_str = local_search_str[match.end(0):]
-                
-                # Break since we have found a match
-                break
+                search_term.append(match_str)
+            else:
+                search_term = SearchTerm(match_str)
+        else:
+            # Append extra spaces within search terms.
+            if search_term:
+                search_term.append(match_str)
+        
+        # Advance past the token.
+        pos = match.end(0)
     
     if search_term:
         search_term.boost = boost
         search_term.fuzz = fuzz
         token_stack.append(search_term)
     if negate:
-        token_stack.append("not_op")
+        token_stack.append(TokenType.NOT)
     
-    if "rparen" in op_queue or "lparen" in op_queue:
+    if TokenType.RPAREN in op_queue or TokenType.LPAREN in op_queue:
         raise ParseError("Mismatched parentheses")
     
-    token_stack += op_queue
+    token_stack.extend(op_queue)
     
     return token_stack
 
 
-def parse_tokens(lexical_array: List[Union[SearchTerm, str]]) -> SearchOperand:
-    operand_stack: List[SearchOperand] = []
+_BINARY_OPERATORS: Dict[TokenType, Callable[[SearchOperand, SearchOperand], SearchOperand]] = {
+    TokenType.AND: AndOperator,
+    TokenType.OR: OrOperator,
+}
+_UNARY_OPERATORS: Dict[TokenType, Callable[[SearchOperand], SearchOperand]] = {
+    TokenType.NOT: NotOperator,
+}
+
+
+def _parses(term: SearchTerm) -> bool:
+    "parse `term` ahead of time, errors are left for match() to raise"
+    
+    try:
+        term.parse()
+    except ValueError:
+        return False
+    return True
+
+
+def parse_tokens(lexical_array: List[Union[SearchTerm, TokenType]]) -> SearchOperand:
+    # each operand comes with whether all of its terms parse
+    operand_stack: List[Tuple[SearchOperand, bool]] = []
     
     for token in lexical_array:
         if isinstance(token, SearchTerm):
-            operand_stack.append(token)
-        elif token in ("and_op", "or_op"):
+            operand_stack.append((token, _parses(token)))
+        elif token in _BINARY_OPERATORS:
             try:
-                op2 = operand_stack.pop()
-                op1 = operand_stack.pop()
+                op2, ok2 = operand_stack.pop()
+                op1, ok1 = operand_stack.pop()
             except IndexError:
                 raise ParseError("Missing operand")
-            if token == "and_op":
-                operand_stack.append(AndOperator(op1, op2))
-            else:
-                operand_stack.append(OrOperator(op1, op2))
-        elif token == "not_op":
+            # both operators are commutative, so the cheaper operand can short-circuit the other.
+            # a term that fails to parse raises once it is matched, so those keep the order they were written in.
+            if ok1 and ok2 and op2.cost < op1.cost:
+                op1, op2 = op2, op1
+            operand_stack.append((_BINARY_OPERATORS[token](op1, op2), ok1 and ok2))
+        elif token in _UNARY_OPERATORS:
             try:
-                op = operand_stack.pop()
+                op, ok = operand_stack.pop()
             except IndexError:
                 raise ParseError("Missing operand")
-            operand_stack.append(NotOperator(op))
+            operand_stack.append((_UNARY_OPERATORS[token](op), ok))
         else:
             raise ParseError("Invalid operator")
     
@@ -581,12 +949,20 @@ def parse_tokens(lexical_array: List[Union[SearchTerm, str]]) -> SearchOperand:
         raise ParseError("Missing operator")
     
     try:
-        return operand_stack.pop()
+        return operand_stack.pop()[0]
     except IndexError:
         raise ParseError("Missing search term")
 
 
+@functools.lru_cache(maxsize=512)
 def parse_search(search: str) -> SearchOperand:
+    """
+    parse a search query into a tree of operands.
+    
+    the result is cached per query string, so the returned tree is shared
+    between callers and must not be modified.
+    """
+    
     return parse_tokens(generate_lex_array(search))
 
 
@@ -0,0 +1,72 @@
+import threading
+import time
+
+from typing import Optional
+
+__all__ = ["RateLimiter"]
+
+
+class RateLimiter:
+    """
+    an adaptive token bucket to stay below a server's rate limit.
+    
+    the send rate grows additively with every successful request and is cut
+    multiplicatively whenever the server rejects a request (HTTP 429).
+    """
+    
+    def __init__(
+        self,
+        rate: float = 10.0,
+        capacity: float = 10.0,
+        increase: float = 0.5,
+        decrease: float = 0.5,
+        min_rate: float = 0.5,
+        max_rate: Optional[float] = 50.0,
+    ):
+        """
+        `rate` is the initial number of requests per second, `capacity` the size of bursts.
+        on success the rate grows by `increase`, up to `max_rate`;
+        on rejection it is multiplied by `decrease`, down to `min_rate`.
+        """
+        
+        self.rate = rate
+        self.capacity = capacity
+        self.increase = increase
+        self.decrease = decrease
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        
+        self.tokens = capacity
+        self.timestamp = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+    
+    def acquire(self) -> None:
+        "wait until the next request may be sent"
+        
+        with self._lock:
+            self._refill()
+            # take the token right away, even if that means going below zero,
+            # so concurrent callers queue up behind each other
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        
+        if wait > 0:
+            time.sleep(wait)
+    
+    def on_success(self) -> None:
+        with self._lock:
+            rate = self.rate + self.increase
+            if self.max_rate is not None:
+                rate = min(rate, self.max_rate)
+            self.rate = rate
+    
+    def on_rejected(self) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = max(self.rate * self.decrease, self.min_rate)
+            self.tokens = min(self.tokens, 0)
@@ -1,4 +1,5 @@
-from typing import Dict, List, Optional, Sequence, Union
+from datetime import datetime
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
 
 from . import utils
 
@@ -61,6 +62,50 @@ class Image(utils.JSONClass):
     view_url: str
     width: int
     wilson_score: float
+    
+    _parsed_dates: Dict[str, Tuple[str, datetime]]
+    _tags_lower: Tuple[List[str], FrozenSet[str]]
+    
+    @property
+    def tags_lower(self) -> FrozenSet[str]:
+        """
+        all tags in lower case, for fast lookups.
+        `tags` is treated as immutable: the set is built again when another list is assigned,
+        but changes made to the list in place are not noticed.
+        """
+        
+        tags = self.tags
+        try:
+            cached, tags_lower = self._tags_lower
+        except AttributeError:
+            pass
+        else:
+            if cached is tags:
+                return tags_lower
+        
+        tags_lower = frozenset(tag.lower() for tag in tags)
+        self._tags_lower = (tags, tags_lower)
+        return tags_lower
+    
+    def get_datetime(self, field: str) -> datetime:
+        """
+        get a date field like `created_at` as a datetime.
+        the parsed value is cached for as long as the field is not changed.
+        """
+        
+        value = getattr(self, field)
+        try:
+            cache = self._parsed_dates
+        except AttributeError:
+            cache = self._parsed_dates = {}
+        
+        cached = cache.get(field)
+        if cached is not None and cached[0] == value:
+            return cached[1]
+        
+        date = utils.parse_datetime(value)
+        cache[field] = (value, date)
+        return date
 
 
 class Tag(utils.JSONClass):
@@ -1,8 +1,10 @@
 import abc
+import dateutil.parser
 
+from datetime import datetime
 from typing import Any, Dict, List, Tuple, Type
 
-__all__ = ["JSONClass", "get_class_name"]
+__all__ = ["JSONClass", "get_class_name", "parse_datetime"]
 
 
 class JSONClass(abc.ABC):
@@ -33,3 +35,12 @@ def get_class_name(clz: Type) -> str:
         return clz.__qualname__
     return module + '.' + clz.__qualname__
 
+
+def parse_datetime(value: str) -> datetime:
+    "parse an ISO 8601 timestamp as returned by the API"
+    
+    try:
+        # implemented in C, but only understands all API formats since Python 3.11
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.isoparse(value)
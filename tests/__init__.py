@@ -0,0 +1,28 @@
+import functools
+import os
+import pathlib
+
+import pylomena
+
+# opt-in HTTP cache, so repeated test runs do not have to hit the API again
+CACHE_ENABLED = os.environ.get("PYLOMENA_TEST_CACHE", "") not in ("", "0")
+
+if CACHE_ENABLED:
+    import requests_cache
+    
+    # sessions created from now on are cached, including the ones created by `pylomena.Site`
+    requests_cache.install_cache(
+        str(pathlib.Path(__file__).with_name(".http_cache")),
+        backend="sqlite",
+        expire_after=86400,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def shared_site(name: str) -> pylomena.Site:
+    """
+    get the site from `pylomena.KNOWN_SITES` that is shared by all tests.
+    they all use its connection pool and rate limiter, so they must not close it.
+    """
+    
+    return pylomena.Site(pylomena.KNOWN_SITES[name])
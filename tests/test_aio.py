@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import asyncio
+import unittest
+
+from typing import Awaitable, Callable, List, TypeVar
+from unittest import mock
+
+import pylomena
+
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type: ignore[assignment]
+
+T = TypeVar("T")
+
+
+class FakeServer:
+    "serves a search with `total` images, at most 50 per page like Philomena, and records the pages requested"
+    
+    def __init__(self, total: int, throttle: int = 0):
+        self.total = total
+        # that many requests are answered with HTTP 429 first
+        self.throttle = throttle
+        self.pages: List[int] = []
+        self.paths: List[str] = []
+    
+    def __call__(self, request: "httpx.Request") -> "httpx.Response":
+        self.paths.append(request.url.path)
+        if self.throttle:
+            self.throttle -= 1
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        
+        if request.url.path.endswith("/images/0"):
+            return httpx.Response(200, json={"image": {"id": 0, "tags": ["safe"]}})
+        
+        page = int(request.url.params.get("page", 1))
+        per_page = min(int(request.url.params.get("per_page", 25)), 50)
+        self.pages.append(page)
+        
+        start = (page - 1) * per_page
+        images = [{"id": i} for i in range(start, min(start + per_page, self.total))]
+        return httpx.Response(200, json={"images": images, "total": self.total})
+
+
+@unittest.skipIf(httpx is None, "AsyncSite requires httpx")
+class TestAsyncSite(unittest.TestCase):
+    def run_site(self, server: FakeServer, test: Callable[[pylomena.AsyncSite], Awaitable[T]]) -> T:
+        "run `test` with a site whose requests all go to `server`"
+        
+        async def run() -> T:
+            site = pylomena.AsyncSite("https://example.org/")
+            await site.client.aclose()
+            site.client = httpx.AsyncClient(transport=httpx.MockTransport(server))
+            
+            async with site:
+                return await test(site)
+        
+        return asyncio.run(run())
+    
+    def test_pages(self) -> None:
+        # (total, per_page, prefetch), the server never returns more than 50 images per page
+        cases = [
+            (0, 50, 3),
+            (1, 50, 3),
+            (50, 50, 3),
+            (1234, 50, 3),
+            (1234, 20, 3),
+            (1000, 100, 3),
+            (1234, 100, 0),
+            (1234, 100, 10),
+        ]
+        for total, per_page, prefetch in cases:
+            with self.subTest(total=total, per_page=per_page, prefetch=prefetch):
+                server = FakeServer(total)
+                
+                async def search(site: pylomena.AsyncSite) -> List[int]:
+                    params = {"q": "*", "per_page": per_page}
+                    images: pylomena.AsyncPaginatedResult[pylomena.Image] = site.api_call_paginated(
+                        "search/images", "images", params=params, t=pylomena.Image, prefetch=prefetch,
+                    )
+                    return [image.id async for image in images]
+                
+                self.assertEqual(list(range(total)), self.run_site(server, search))
+                
+                # every page is requested once, the first empty page is the last one requested
+                last = -(-total // min(per_page, 50)) + 1
+                self.assertEqual(list(range(1, last + 1)), sorted(server.pages))
+    
+    def test_aclose(self) -> None:
+        server = FakeServer(1234)
+        
+        async def stop_early(site: pylomena.AsyncSite) -> List[int]:
+            images = site.search_images("*", per_page=100)
+            ids = []
+            async for image in images:
+                ids.append(image.id)
+                if len(ids) == 60:
+                    break
+            
+            # the prefetch window is still open, closing the site stops it before the client is closed
+            pending = list(images._pending)
+            self.assertFalse(all(task.done() for task in pending))
+            
+            await site.aclose()
+            self.assertTrue(all(task.done() for task in pending))
+            self.assertEqual([], list(images._pending))
+            self.assertTrue(site.client.is_closed)
+            return ids
+        
+        self.assertEqual(list(range(60)), self.run_site(server, stop_early))
+        self.assertLessEqual(max(server.pages), 2 + 3)
+    
+    def test_get_image(self) -> None:
+        server = FakeServer(0)
+        
+        async def get_image(site: pylomena.AsyncSite) -> pylomena.Image:
+            return await site.get_image(0)
+        
+        image = self.run_site(server, get_image)
+        self.assertEqual(0, image.id)
+        self.assertEqual(["safe"], image.tags)
+        self.assertEqual(["/api/v1/json/images/0"], server.paths)
+    
+    def test_retry(self) -> None:
+        server = FakeServer(0, throttle=2)
+        
+        async def get_image(site: pylomena.AsyncSite) -> pylomena.Image:
+            return await site.get_image(0)
+        
+        # the delay itself is tested along with `Site`
+        with mock.patch("pylomena.aio._retry_delay", return_value=0.0) as retry_delay:
+            image = self.run_site(server, get_image)
+        
+        self.assertEqual(0, image.id)
+        self.assertEqual(3, len(server.paths))
+        self.assertEqual(2, retry_delay.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
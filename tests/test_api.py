@@ -1,22 +1,33 @@
-#!/usr/bin/env python3
-
+import datetime
+import email.utils
+import itertools
+import json
+import requests
+import threading
 import unittest
 
+from typing import cast, Any, Iterator, List, Optional, Tuple, Union
+
 import pylomena
 
+from tests import shared_site
+
 
 class TestApi(unittest.TestCase):
-    def setUp(self) -> None:
-        self.derpibooru = pylomena.Site(pylomena.KNOWN_SITES["derpibooru"])
+    derpibooru: pylomena.Site
     
-    def tearDown(self) -> None:
-        pass
+    @classmethod
+    def setUpClass(clz) -> None:
+        # the site is not modified by any test, so all of them can share it
+        clz.derpibooru = shared_site("derpibooru")
     
     def test_image(self) -> None:
         img = self.derpibooru.get_image(0)
         
-        self.assertIn("derpy hooves", img.tags)
-        self.assertNotIn("rainbow dash", img.tags)
+        # set operations report all missing or unexpected entries at once
+        tags = frozenset(img.tags)
+        self.assertEqual(set(), {"derpy hooves"} - tags)
+        self.assertEqual(set(), {"rainbow dash"} & tags)
         
         self.assertEqual(0, img.id)
     
@@ -27,21 +38,22 @@ class TestApi(unittest.TestCase):
         
         tag = self.derpibooru.get_tag(slug)
         
-        self.assertIn("oc-colon-button%27s+mom", tag.aliases)
-        self.assertNotIn("rd", tag.aliases)
+        aliases = frozenset(tag.aliases)
+        self.assertEqual(set(), {"oc-colon-button%27s+mom"} - aliases)
+        self.assertEqual(set(), {"rd"} & aliases)
         
         self.assertEqual("oc", tag.category)
         self.assertEqual("oc:cream heart", tag.name)
         self.assertEqual("cream heart", tag.name_in_namespace)
         self.assertEqual(slug, tag.slug)
         
-        self.assertIn("creamac", tag.implied_by_tags)
+        self.assertEqual(set(), {"creamac"} - frozenset(tag.implied_by_tags))
     
     def test_filter(self) -> None:
         filter = self.derpibooru.get_filter(100073)
         
-        self.assertIn(26707, filter.hidden_tag_ids)
-        self.assertIn(43502, filter.spoilered_tag_ids)
+        self.assertEqual(set(), {26707} - frozenset(filter.hidden_tag_ids))
+        self.assertEqual(set(), {43502} - frozenset(filter.spoilered_tag_ids))
         
         self.assertEqual("Default", filter.name)
         self.assertEqual(100073, filter.id)
@@ -51,24 +63,27 @@ class TestApi(unittest.TestCase):
         self.assertIsNone(filter.user_id)
     
     def test_search_images(self) -> None:
-        imgs = self.derpibooru.search_images("rd, fs, -ts, aspect_ratio.gt:1", per_page=50)
-        
-        for i in range(100):
-            img = next(imgs)
-            self.assertIn("rainbow dash", img.tags)
-            self.assertIn("fluttershy", img.tags)
-            self.assertNotIn("twilight sparkle", img.tags)
-            self.assertGreater(img.aspect_ratio, 1)
-            self.assertGreater(img.width, img.height)
+        imgs = list(itertools.islice(self.derpibooru.search_images("rd, fs, -ts, aspect_ratio.gt:1", per_page=50), 100))
+        self.assertEqual(100, len(imgs))
+        
+        # one assertion per condition, reporting the ids of all offending images at once
+        self.assertEqual([], [img.id for img in imgs if "rainbow dash" not in img.tags])
+        self.assertEqual([], [img.id for img in imgs if "fluttershy" not in img.tags])
+        self.assertEqual([], [img.id for img in imgs if "twilight sparkle" in img.tags])
+        self.assertEqual([], [img.id for img in imgs if not img.aspect_ratio > 1])
+        self.assertEqual([], [img.id for img in imgs if not img.width > img.height])
     
     def test_search_tags(self) -> None:
-        tags = self.derpibooru.search_tags("namespace:oc", per_page=50)
+        tags = list(itertools.islice(self.derpibooru.search_tags("namespace:oc", per_page=50), 100))
+        self.assertEqual(100, len(tags))
         
-        for i in range(100):
-            tag = next(tags)
-            self.assertEqual("oc", tag.namespace)
-            self.assertTrue(tag.name.startswith("oc:"))
-            self.assertTrue(tag.slug.startswith("oc-colon-"))
+        bad = [
+            tag.name
+            for tag
+            in tags
+            if tag.namespace != "oc" or not tag.name.startswith("oc:") or not tag.slug.startswith("oc-colon-")
+        ]
+        self.assertEqual([], bad)
     
     def test_search_filters(self) -> None:
         filters = self.derpibooru.search_filters("system:true", per_page=5)
@@ -79,14 +94,23 @@ class TestApi(unittest.TestCase):
     # TODO: more test cases
     
     def test_tag_conversion(self) -> None:
-        self.assertEqual(self.derpibooru.tag_to_slug("derpy hooves"), "derpy+hooves")
-        self.assertEqual(self.derpibooru.tag_to_slug("oc:button mash"), "oc-colon-button+mash")
-        
-        self.assertEqual(self.derpibooru.tag_to_slug("mane five (g5)", False), "mane+five+(g5)")
-        self.assertEqual(self.derpibooru.tag_to_slug("frog (hoof)", True), "frog+%28hoof%29")
-        
-        self.assertEqual(self.derpibooru.tag_to_slug("dj pon-3", True), "dj+pon-dash-3")
-        self.assertEqual(self.derpibooru.tag_to_slug("test_test", True), "test_test")
+        # (name, safe, slug), `None` tests the default
+        cases: List[Tuple[str, Optional[bool], str]] = [
+            ("derpy hooves", None, "derpy+hooves"),
+            ("oc:button mash", None, "oc-colon-button+mash"),
+            
+            ("mane five (g5)", False, "mane+five+(g5)"),
+            ("frog (hoof)", True, "frog+%28hoof%29"),
+            
+            ("dj pon-3", True, "dj+pon-dash-3"),
+            ("test_test", True, "test_test"),
+        ]
+        for name, safe, slug in cases:
+            with self.subTest(name=name, safe=safe):
+                if safe is None:
+                    self.assertEqual(slug, self.derpibooru.tag_to_slug(name))
+                else:
+                    self.assertEqual(slug, self.derpibooru.tag_to_slug(name, safe))
     
     def test_valid_tags(self) -> None:
         self.derpibooru.validate_tag_slug("test")
@@ -94,35 +118,140 @@ class TestApi(unittest.TestCase):
         self.derpibooru.validate_tag_slug("test-colon-test-dash-test-dot-test")
         self.derpibooru.validate_tag_slug("test%25test%27test%2b")
         
-        with self.assertRaises(ValueError, msg="Invalid character"):
-            self.derpibooru.validate_tag_slug(" ")
-        with self.assertRaises(ValueError, msg="Invalid character"):
-            self.derpibooru.validate_tag_slug("#")
-        with self.assertRaises(ValueError, msg="Incomplete escape sequence"):
-            self.derpibooru.validate_tag_slug("-")
-        with self.assertRaises(ValueError, msg="Invalid escape sequence"):
-            self.derpibooru.validate_tag_slug("-dash")
-        with self.assertRaises(ValueError, msg="Incomplete escape sequence"):
-            self.derpibooru.validate_tag_slug("%")
-        with self.assertRaises(ValueError, msg="Invalid escape sequence"):
-            self.derpibooru.validate_tag_slug("%gg")
-        
-        for i, tag in enumerate(self.derpibooru.search_tags("*", per_page=50)):
-            if i >= 50:
-                break
-            
+        invalid = [
+            (" ", "Invalid character"),
+            ("#", "Invalid character"),
+            ("-", "Incomplete escape sequence"),
+            ("-dash", "Invalid escape sequence"),
+            ("%", "Incomplete escape sequence"),
+            ("%gg", "Invalid escape sequence"),
+        ]
+        for slug, reason in invalid:
+            with self.subTest(slug=slug), self.assertRaises(ValueError, msg=reason):
+                self.derpibooru.validate_tag_slug(slug)
+        
+        tags = list(itertools.islice(self.derpibooru.search_tags("*", per_page=50), 50))
+        
+        # the site escapes some tags in safe mode and some not, either is fine
+        slugs = []
+        for tag in tags:
             slug = self.derpibooru.tag_to_slug(tag.name, True)
             if slug != tag.slug:
                 slug = self.derpibooru.tag_to_slug(tag.name, False)
-            self.assertEqual(tag.slug, slug)
-            
+            slugs.append(slug)
+        self.assertEqual([tag.slug for tag in tags], slugs)
+        
+        invalid = []
+        for tag in tags:
             try:
                 self.derpibooru.validate_tag_slug(tag.slug)
-            except Exception:
-                print(tag.slug)
-                raise
+            except ValueError as e:
+                invalid.append((tag.slug, str(e)))
+        self.assertEqual([], invalid)
+
 
+class TestRetryAfter(unittest.TestCase):
+    def test_parse_retry_after(self) -> None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        in_a_minute = email.utils.format_datetime(now + datetime.timedelta(minutes=1), usegmt=True)
+        a_minute_ago = email.utils.format_datetime(now - datetime.timedelta(minutes=1), usegmt=True)
+        
+        # (header, seconds), `None` means the header is ignored
+        cases: List[Tuple[Optional[str], Optional[float]]] = [
+            ("120", 120.0),
+            ("0", 0.0),
+            (" 7 ", 7.0),
+            ("-5", -5.0),
+            (in_a_minute, 60.0),
+            (a_minute_ago, -60.0),
+            (None, None),
+            ("", None),
+            ("1.5", None),
+            ("soon", None),
+            ("Someday, 32 Foo 2015", None),
+        ]
+        for value, expected in cases:
+            with self.subTest(value=value):
+                delay = pylomena.Site._parse_retry_after(value)
+                if expected is None:
+                    self.assertIsNone(delay)
+                else:
+                    self.assertIsNotNone(delay)
+                    # HTTP dates only have a resolution of one second
+                    self.assertAlmostEqual(expected, cast(float, delay), delta=2.0)
 
-if __name__ == '__main__':
-    unittest.main()
 
+class FakeSession(requests.Session):
+    "serves a search with `total` images, at most 50 per page like Philomena, and records the pages requested"
+    
+    def __init__(self, total: int):
+        super().__init__()
+        self.total = total
+        self.pages: List[int] = []
+        self._lock = threading.Lock()
+    
+    def get(self, url: Union[str, bytes], **kwargs: Any) -> requests.Response:
+        params = kwargs.get("params") or {}
+        page = int(params.get("page", 1))
+        per_page = min(int(params.get("per_page", 25)), 50)
+        
+        # pages are prefetched from other threads
+        with self._lock:
+            self.pages.append(page)
+        
+        start = (page - 1) * per_page
+        images = [{"id": i} for i in range(start, min(start + per_page, self.total))]
+        
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({"images": images, "total": self.total}).encode()
+        return response
+
+
+class TestPagination(unittest.TestCase):
+    def search(self, total: int, per_page: int, prefetch: int = 3) -> Tuple[List[int], List[int]]:
+        "iterate over a whole search, returns the image ids and the pages requested"
+        
+        with pylomena.Site("https://example.org/", rate_limit=False) as site:
+            session = site.session = FakeSession(total)
+            
+            params = {"q": "*", "per_page": per_page}
+            images: Iterator[pylomena.Image] = site.api_call_paginated(
+                "search/images", "images", params=params, t=pylomena.Image, prefetch=prefetch,
+            )
+            ids = [image.id for image in images]
+        
+        return ids, session.pages
+    
+    def test_pages(self) -> None:
+        # (total, per_page, prefetch), the server never returns more than 50 images per page
+        cases = [
+            (0, 50, 3),
+            (1, 50, 3),
+            (50, 50, 3),
+            (1234, 50, 3),
+            (1234, 20, 3),
+            (1000, 100, 3),
+            (1234, 100, 3),
+            (1234, 100, 0),
+            (1234, 100, 10),
+        ]
+        for total, per_page, prefetch in cases:
+            with self.subTest(total=total, per_page=per_page, prefetch=prefetch):
+                ids, pages = self.search(total, per_page, prefetch)
+                self.assertEqual(list(range(total)), ids)
+                
+                # every page is requested once, the first empty page is the last one requested
+                last = -(-total // min(per_page, 50)) + 1
+                self.assertEqual(list(range(1, last + 1)), sorted(pages))
+    
+    def test_stop_early(self) -> None:
+        # only pages up to the prefetch window are requested when iteration stops early
+        with pylomena.Site("https://example.org/", rate_limit=False) as site:
+            session = site.session = FakeSession(1234)
+            
+            images = site.search_images("*", per_page=100)
+            self.assertEqual(list(range(60)), [image.id for image in itertools.islice(images, 60)])
+            images.close()
+            
+            self.assertLessEqual(max(session.pages), 2 + 3)
@@ -1,26 +1,37 @@
 #!/usr/bin/env python3
 
-import pathlib
-import subprocess
 import sys
+import unittest
+
+from typing import Iterator
+
+# these classes fetch data that other tests need as well (e.g. image 0),
+# they run before all others, so the others find it in the cache of the shared site
+WARM_UP = ("TestMatcher",)
+
+
+def iter_tests(suite: unittest.TestSuite) -> Iterator[unittest.TestCase]:
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            yield from iter_tests(test)
+        else:
+            yield test
 
 
 def main() -> None:
-    this = pathlib.Path(__file__).name
-    
-    tests = [
-        str(path)
-        for path
-        in pathlib.Path("tests").glob("*.py")
-        if path.name != this
-    ]
+    tests = list(iter_tests(unittest.defaultTestLoader.discover("tests", pattern="test_*.py", top_level_dir=".")))
     
     if not tests:
         raise ValueError("No tests found!")
     
-    sys.exit(subprocess.call((sys.executable, "-m", "unittest", *tests)))
+    # the tests run one after another in this process, not in parallel: they share one site (`tests.shared_site`),
+    # whose rate limiter caps the requests of all of them anyway, and the warm-up only helps the tests after it.
+    # the warm-up classes run first, all others after them in the order they were discovered
+    suite = unittest.TestSuite(sorted(tests, key=lambda test: type(test).__name__ not in WARM_UP))
+    
+    result = unittest.TextTestRunner().run(suite)
+    sys.exit(0 if result.wasSuccessful() else 1)
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,19 +1,25 @@
-#!/usr/bin/env python3
-
 import datetime
 import unittest
 
-from typing import Optional, Sequence
+from typing import Optional, Sequence, Tuple
+from unittest import mock
 
 import pylomena
 
+from tests import shared_site
+
 Interactions = Optional[Sequence[pylomena.Interaction]]
 
 
 class TestMatcher(unittest.TestCase):
-    def setUp(self) -> None:
-        self.derpibooru = pylomena.Site(pylomena.KNOWN_SITES["derpibooru"])
-        self.img = self.derpibooru.get_image(0)
+    derpibooru: pylomena.Site
+    img: pylomena.Image
+    
+    @classmethod
+    def setUpClass(clz) -> None:
+        # shared by all tests, those that modify the image have to restore it
+        clz.derpibooru = shared_site("derpibooru")
+        clz.img = clz.derpibooru.get_image(0)
     
     def match(self, query: str, interactions: Interactions = None) -> bool:
         return pylomena.parse_search(query).match(self.img, interactions)
@@ -24,82 +30,128 @@ class TestMatcher(unittest.TestCase):
     def assertNonMatch(self, query: str, interactions: Interactions = None) -> None:
         self.assertFalse(self.match(query, interactions))
     
-    def test_tags(self) -> None:
-        self.assertMatch("dErPy HoOvEs")
-        self.assertNonMatch("rainbow dash")
-        
-        self.assertMatch("derpy hooves AND safe")
-        self.assertMatch("derpy hooves && safe")
-        self.assertMatch("derpy hooves,safe")
-        self.assertMatch("derpy hooves OR rainbow dash")
-        self.assertMatch("derpy hooves || rainbow dash")
+    def assertMatches(self, cases: Sequence[Tuple[str, bool]], img: Optional[pylomena.Image] = None) -> None:
+        """
+        check a table of queries and whether each of them should match, reporting every failing query.
+        the queries are matched against `img` if given, otherwise against image 0.
+        """
         
-        self.assertNonMatch("derpy hooves AND rainbow dash")
-        self.assertNonMatch("twilight sparkle OR rainbow dash")
+        target = self.img if img is None else img
+        for query, expected in cases:
+            with self.subTest(query=query):
+                self.assertEqual(expected, pylomena.parse_search(query).match(target))
+    
+    def test_tags(self) -> None:
+        self.assertMatches([
+            ("dErPy HoOvEs", True),
+            ("rainbow dash", False),
+            
+            ("derpy hooves AND safe", True),
+            ("derpy hooves && safe", True),
+            ("derpy hooves,safe", True),
+            ("derpy hooves OR rainbow dash", True),
+            ("derpy hooves || rainbow dash", True),
+            
+            ("derpy hooves AND rainbow dash", False),
+            ("twilight sparkle OR rainbow dash", False),
+            
+            ("!derpy hooves", False),
+            ("-safe", False),
+            ("NOT rainbow dash", True),
+            
+            ("derpy hooves AND (safe OR rainbow dash)", True),
+            ("twilight sparkle OR (safe AND derpy hooves)", True),
+            ("(safe OR rainbow dash) AND derpy hooves", True),
+            ("(safe AND derpy hooves) OR twilight sparkle", True),
+        ])
         
-        self.assertNonMatch("!derpy hooves")
-        self.assertNonMatch("-safe")
-        self.assertMatch("NOT rainbow dash")
+        # wildcards, a backslash escapes the next character, two of them are a literal backslash
+        img = pylomena.Image({"id": 1, "tags": ["abc", "x*y", "a\\b"]})
+        self.assertMatches([
+            ("a*", True),
+            ("*c", True),
+            ("a?*", True),
+            ("a?", False),
+            ("a**", True),
+            ("x*", True),
+            
+            ("a\\*", False),
+            ("a\\b*", True),
+            ("x\\*y", True),
+            ("x\\*", False),
+            
+            ("a\\\\b", True),
+            ("a\\\\*", True),
+            ("a\\\\?", True),
+            ("a\\b", False),
+            ("a\\\\\\*", False),
+        ], img)
         
-        self.assertMatch("derpy hooves AND (safe OR rainbow dash)")
-        self.assertMatch("twilight sparkle OR (safe AND derpy hooves)")
-        self.assertMatch("(safe OR rainbow dash) AND derpy hooves")
-        self.assertMatch("(safe AND derpy hooves) OR twilight sparkle")
+        # tags are looked up in a cached set, assigning a new list replaces it
+        img.tags = img.tags + ["Safe"]
+        self.assertMatches([("safe", True), ("a\\*", False)], img)
     
     def test_numbers(self) -> None:
-        self.assertMatch("width:800")
-        self.assertNonMatch("width:700")
-        
-        self.assertMatch("width.gt:700")
-        self.assertMatch("width.lt:900")
-        
-        self.assertMatch("width.gte:700")
-        self.assertMatch("width.lte:900")
-        
-        self.assertMatch("width.gte:800")
-        self.assertMatch("width.lte:800")
-        
-        self.assertNonMatch("width.gt:800")
-        self.assertNonMatch("width.lt:800")
-        
-        self.assertNonMatch("width.gte:900")
-        self.assertNonMatch("width.lte:700")
-        
-        self.assertMatch("height:700")
-        self.assertNonMatch("height:800")
-        
-        self.assertMatch("aspect_ratio.gt:1")
-        self.assertNonMatch("aspect_ratio.lt:1")
-        
-        self.assertMatch("upvotes.gt:100")
-        self.assertMatch("downvotes.gt:1")
-        self.assertMatch("score.gt:1")
-        self.assertMatch("faves.gt:1")
-        self.assertMatch("tag_count.gt:1")
+        self.assertMatches([
+            ("width:800", True),
+            ("width:700", False),
+            
+            ("width.gt:700", True),
+            ("width.lt:900", True),
+            
+            ("width.gte:700", True),
+            ("width.lte:900", True),
+            
+            ("width.gte:800", True),
+            ("width.lte:800", True),
+            
+            ("width.gt:800", False),
+            ("width.lt:800", False),
+            
+            ("width.gte:900", False),
+            ("width.lte:700", False),
+            
+            ("height:700", True),
+            ("height:800", False),
+            
+            ("aspect_ratio.gt:1", True),
+            ("aspect_ratio.lt:1", False),
+            
+            ("upvotes.gt:100", True),
+            ("downvotes.gt:1", True),
+            ("score.gt:1", True),
+            ("faves.gt:1", True),
+            ("tag_count.gt:1", True),
+        ])
     
     def test_fuzzy(self) -> None:
-        self.assertMatch("derpy hovet~2.0")
-        self.assertNonMatch("derpy hovet~1.0")
-        self.assertMatch("derppyy hovet~4.0")
-        self.assertNonMatch("derppyy hovet~3.0")
+        self.assertMatches([
+            ("derpy hovet~2.0", True),
+            ("derpy hovet~1.0", False),
+            ("derppyy hovet~4.0", True),
+            ("derppyy hovet~3.0", False),
+        ])
     
     def test_dates_abs(self) -> None:
-        self.assertMatch("created_at:2012")
-        self.assertMatch("created_at:2012-01")
-        self.assertMatch("created_at:2012-01-02")
-        
-        self.assertMatch("created_at.gt:2012-01-01")
-        self.assertMatch("created_at.gt:2011-12")
-        self.assertMatch("created_at.gt:2011")
-        
-        self.assertMatch("created_at.lt:2012-01-03")
-        self.assertMatch("created_at.lt:2012-02")
-        self.assertMatch("created_at.lt:2013")
+        self.assertMatches([
+            ("created_at:2012", True),
+            ("created_at:2012-01", True),
+            ("created_at:2012-01-02", True),
+            
+            ("created_at.gt:2012-01-01", True),
+            ("created_at.gt:2011-12", True),
+            ("created_at.gt:2011", True),
+            
+            ("created_at.lt:2012-01-03", True),
+            ("created_at.lt:2012-02", True),
+            ("created_at.lt:2013", True),
+        ])
     
     def test_dates_rel(self) -> None:
-        now = datetime.datetime.now().astimezone(tz=datetime.timezone.utc)
+        # relative dates are anchored on the current hour, so the date is as well
+        now = datetime.datetime.now(tz=datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
         date = now - datetime.timedelta(hours=1, minutes=30)
-        datestr = date.strftime("%Y-%m-%dT%H:%M:%MZ")
+        datestr = date.strftime("%Y-%m-%dT%H:%M:%SZ")
         
         origdate = self.img.created_at
         try:
@@ -151,6 +203,76 @@ class TestMatcher(unittest.TestCase):
         self.assertNonMatch("my:downvotes", interactions)
 
 
-if __name__ == '__main__':
-    unittest.main()
+class TestInteractionIndex(unittest.TestCase):
+    def setUp(self) -> None:
+        self.images = [pylomena.Image({"id": i, "tags": ["safe"]}) for i in range(500)]
+        self.interactions = [
+            pylomena.Interaction({"image_id": i, "interaction_type": "faved", "user_id": 0, "value": ""})
+            for i in range(0, 1000, 3)
+        ] + [
+            pylomena.Interaction({"image_id": i, "interaction_type": "voted", "user_id": 0, "value": "up"})
+            for i in range(0, 1000, 5)
+        ]
+    
+    def test_matches_list(self) -> None:
+        index = pylomena.InteractionIndex(self.interactions)
+        for query in ("my:faves", "my:upvotes", "my:downvotes", "my:faves OR my:upvotes", "-my:faves AND safe"):
+            with self.subTest(query=query):
+                search = pylomena.parse_search(query)
+                expected = [search.match(image, self.interactions) for image in self.images]
+                self.assertEqual(expected, [search.match(image, index) for image in self.images])
+    
+    def test_built_once(self) -> None:
+        # matching one user's interactions against many images must not index them again for every image
+        build = pylomena.InteractionIndex._build
+        with mock.patch.object(pylomena.InteractionIndex, "_build", autospec=True, side_effect=build) as mocked:
+            index = pylomena.InteractionIndex(self.interactions)
+            search = pylomena.parse_search("my:faves OR my:upvotes")
+            matches = [image.id for image in self.images if search.match(image, index)]
+            
+            self.assertEqual(1, mocked.call_count)
+            self.assertEqual([i for i in range(500) if i % 3 == 0 or i % 5 == 0], matches)
+            
+            # a plain list is scanned, it is never indexed
+            for image in self.images:
+                search.match(image, self.interactions)
+            self.assertEqual(1, mocked.call_count)
+
 
+class TestImageBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        data: Sequence[pylomena.JSONObject] = [
+            {"id": 0, "tags": ["safe"], "width": 800, "height": 700, "aspect_ratio": 800 / 700, "score": 10},
+            {"id": 1, "tags": ["explicit"], "width": 1000, "height": 500, "aspect_ratio": 2.0, "score": -3},
+            {"id": 2, "tags": ["safe"], "width": 300, "height": 600, "aspect_ratio": 0.5, "score": 0},
+            # NaN never matches a comparison, but its negation does
+            {"id": 3, "tags": [], "width": 100, "height": 100, "aspect_ratio": float("nan"), "score": 0},
+        ]
+        self.images = [pylomena.Image(i) for i in data]
+    
+    def test_match_batch(self) -> None:
+        queries = [
+            "width:800",
+            "width.gt:700",
+            "width.lte:800",
+            "height.gte:600",
+            "score.lt:0",
+            "score:0",
+            "width:790~20",
+            "aspect_ratio.gt:1",
+            "aspect_ratio.lte:1",
+            "-aspect_ratio.gt:1",
+            "NOT width:800",
+            "width.gt:500 AND height.lt:650",
+            "aspect_ratio.lt:1 OR score.gt:5",
+            "-(aspect_ratio.gt:1 OR aspect_ratio.lte:1)",
+            "safe AND width.lt:900",
+            "explicit OR score:0",
+        ]
+        
+        batch = pylomena.ImageBatch(self.images)
+        for query in queries:
+            with self.subTest(query=query):
+                search = pylomena.parse_search(query)
+                expected = [search.match(image) for image in self.images]
+                self.assertEqual(expected, search.match_batch(batch).tolist())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from typing import List
+from unittest import mock
+
+import pylomena
+
+
+class FakeClock:
+    "stands in for the `time` module, sleeping just advances the clock"
+    
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: List[float] = []
+    
+    def monotonic(self) -> float:
+        return self.now
+    
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        patcher = mock.patch("pylomena.ratelimit.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_burst(self) -> None:
+        limiter = pylomena.RateLimiter(rate=10, capacity=3)
+        
+        for i in range(3):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+        
+        # the bucket is drained, the next token takes 1 / rate seconds
+        limiter.acquire()
+        self.assertEqual(1, len(self.clock.sleeps))
+        self.assertAlmostEqual(0.1, self.clock.sleeps[0])
+    
+    def test_refill(self) -> None:
+        limiter = pylomena.RateLimiter(rate=10, capacity=3)
+        
+        for i in range(3):
+            limiter.acquire()
+        
+        # the bucket never holds more than `capacity` tokens
+        self.clock.now += 60
+        for i in range(3):
+            limiter.acquire()
+        self.assertEqual([], self.clock.sleeps)
+        
+        limiter.acquire()
+        self.assertEqual(1, len(self.clock.sleeps))
+        self.assertAlmostEqual(0.1, self.clock.sleeps[0])
+    
+    def test_on_success(self) -> None:
+        limiter = pylomena.RateLimiter(rate=10, increase=0.5, max_rate=11)
+        
+        limiter.on_success()
+        self.assertAlmostEqual(10.5, limiter.rate)
+        limiter.on_success()
+        limiter.on_success()
+        self.assertAlmostEqual(11, limiter.rate)
+        
+        unbounded = pylomena.RateLimiter(rate=10, increase=0.5, max_rate=None)
+        for i in range(10):
+            unbounded.on_success()
+        self.assertAlmostEqual(15, unbounded.rate)
+    
+    def test_on_rejected(self) -> None:
+        limiter = pylomena.RateLimiter(rate=10, capacity=3, decrease=0.5, min_rate=2)
+        
+        limiter.on_rejected()
+        self.assertAlmostEqual(5, limiter.rate)
+        
+        # a rejection drains the bucket, so the next request has to wait for a new token
+        limiter.acquire()
+        self.assertEqual(1, len(self.clock.sleeps))
+        self.assertAlmostEqual(0.2, self.clock.sleeps[0])
+        
+        limiter.on_rejected()
+        limiter.on_rejected()
+        self.assertAlmostEqual(2, limiter.rate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,33 +1,49 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import os
 import requests
 import unittest
 
 import pylomena
 
 
+@unittest.skipUnless(os.environ.get("PYLOMENA_INTEGRATION") == "1", "set PYLOMENA_INTEGRATION=1 to query all sites")
 class TestSites(unittest.TestCase):
+    def probe(self, name: str, site: pylomena.Site) -> None:
+        imgs = site.search_images("*")
+        self.assertGreater(imgs.total, 1000, msg=f"query images from {name}")
+        self.assertIsInstance(next(imgs), pylomena.Image, msg=f"query images from {name}")
+        
+        tags = site.search_tags("*")
+        self.assertGreater(tags.total, 10, msg=f"query tags from {name}")
+        self.assertIsInstance(next(tags), pylomena.Tag, msg=f"query tags from {name}")
+        
+        # not every site implements this API
+        try:
+            filters = site.search_filters("*")
+        except requests.exceptions.HTTPError as e:
+            if e.response.status_code != 404:
+                raise e
+        else:
+            self.assertGreaterEqual(imgs.total, 1, msg=f"query filters from {name}")
+            self.assertIsInstance(next(filters), pylomena.Filter, msg=f"query filters from {name}")
+    
     def test_sites(self) -> None:
-        for name, url in pylomena.KNOWN_SITES.items():
-            site = pylomena.Site(url)
+        # requests-cache is optional, it is only needed once this test actually runs
+        import requests_cache
+        
+        # this checks that the sites are still up, so it always goes to the live endpoints
+        with requests_cache.disabled():
+            sites = {name: pylomena.Site(url) for name, url in pylomena.KNOWN_SITES.items()}
+        
+        # the sites are independent of each other, so they are all queried at once
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(sites)) as executor:
+            futures = {name: executor.submit(self.probe, name, site) for name, site in sites.items()}
             
-            imgs = site.search_images("*")
-            self.assertGreater(imgs.total, 1000, msg=f"query images from {name}")
-            self.assertIsInstance(next(imgs), pylomena.Image, msg=f"query images from {name}")
-            
-            tags = site.search_tags("*")
-            self.assertGreater(tags.total, 10, msg=f"query tags from {name}")
-            self.assertIsInstance(next(tags), pylomena.Tag, msg=f"query tags from {name}")
-            
-            # not every site implements this API
-            try:
-                filters = site.search_filters("*")
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code != 404:
-                    raise e
-            else:
-                self.assertGreaterEqual(imgs.total, 1, msg=f"query filters from {name}")
-                self.assertIsInstance(next(filters), pylomena.Filter, msg=f"query filters from {name}")
+            for name, future in futures.items():
+                with self.subTest(site=name):
+                    future.result()
 
 
 if __name__ == '__main__':